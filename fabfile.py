@@ -63,6 +63,53 @@ def autotest(cmd='fab test', sleep=1):
 
         time.sleep(sleep)
 
+def watch(features='tests/morelia.feature', interval=1):
+    """
+    keep the features, and their steps, in memory, and rerun what each edit touches
+
+    Unlike autotest, this never restarts Python. It re-parses only the changed
+    feature files, reloads the step module when it changes, and reruns only the
+    Scenarios whose feature lines or step methods changed. pyinotify, when
+    installed, wakes it the moment a file changes.
+
+    Usage:
+
+       fab watch
+       fab watch:features='tests/a.feature;tests/b.feature'
+    """
+
+    base = os.path.dirname(fabfile.__file__)
+    sys.path.insert(0, os.path.join(base, 'morelia'))
+    sys.path.insert(0, os.path.join(base, 'tests'))
+    from morelia import Watcher
+    from morelia_suite import MoreliaSuite
+    Watcher(MoreliaSuite('test_feature'), features.split(';'), float(interval)).watch()
+
+def shard(shard, features='tests/morelia.feature', last_run=None):
+    """
+    run one CI node's slice of the features' test cases
+
+    Every node lists the same test cases, and splits them the same way, so
+    N nodes, each running shard i/N, run each case exactly once. Given a
+    last_run file from an earlier run, the split balances the cases by how
+    long each took; without one, it balances them by count.
+
+    Usage:
+
+       fab shard:3/8
+       fab shard:3/8,features='tests/a.feature;tests/b.feature',last_run=timings.json
+    """
+
+    base = os.path.dirname(fabfile.__file__)
+    sys.path.insert(0, os.path.join(base, 'morelia'))
+    sys.path.insert(0, os.path.join(base, 'tests'))
+    from morelia import Parser, Shard
+    from morelia_suite import MoreliaSuite
+    suite = MoreliaSuite('test_feature')
+    parsers = [Parser().parse_file(filename) for filename in features.split(';')]
+    node = Shard(shard, parsers, suite, last_run = last_run)
+    for parser in parsers:  parser.evaluate(suite, shard = node, last_run = last_run)
+
 def test(extra=''):
     'run the short test batch for this project'
 
@@ -14,16 +14,46 @@ __version__ = '0.1.6'
 #  TODO  get working with python 3,4,5, etc...
 #  TODO  put http://www.dawnoftimecomics.com/index.php on comixpedia!
 
+import os
 import re
+import sys
+import time
+import math
+import mmap
+import hashlib
+import inspect
+import linecache
+import tempfile
+import cPickle
+import marshal
+import pstats
+import itertools
+import heapq
+import array
+import csv
+import threading
+from StringIO import StringIO
 
 #  TODO  what happens with blank table items?
 #  ERGO  river is to riparian as pond is to ___?
 
-class Morelia:
+class Morelia(object):
+    __slots__ = ('parent', 'concept', 'predicate', 'steps', 'line_number')  #  what the parse found
+    _blanks = {}  #  class -> every slot it and its bases declare
 
-    def __init__(self):  self.parent = None
+    def __init__(self):  #  slots have no class defaults, so each node starts them all at None
+        for name in self.slot_names():  setattr(self, name, None)
 
-    def _parse(self, predicate, list = [], line_number = 0):
+    def slot_names(self):
+        klass = self.__class__
+        names = Morelia._blanks.get(klass)
+
+        if names is None:
+            names = Morelia._blanks[klass] = sum([getattr(k, '__slots__', ()) for k in klass.__mro__], ())
+
+        return names
+
+    def _parse(self, predicate, list = [], line_number = 0, ancestors = None):
         self.concept = self.my_class_name()
         self.predicate = predicate
         self.steps = []
@@ -32,20 +62,29 @@ class Morelia:
 #  TODO  escape the sample regices already!
 #  and the default code should be 'print <arg_names, ... >'
 
-        for s in list[::-1]:
-            mpt = self.my_parent_type()
+        mpt = self.my_parent_type()
 
-            try:
-                if issubclass(s.__class__, mpt):
-                    s.steps.append(self)  #  TODO  squeek if can't find parent
-                    self.parent = s
-                    break
-            except TypeError, e:
-                self.enforce(False, 'Only one Feature per file')  #  CONSIDER  prevent it don't trap it!!!
+        if ancestors is None:  #  without a Parser's ancestors, scan back through every node so far
+            for s in reversed(list):
+                try:
+                    if issubclass(s.__class__, mpt):
+                        self.adopt(s)
+                        break
+                except TypeError, e:
+                    self.enforce(False, 'Only one Feature per file')  #  CONSIDER  prevent it don't trap it!!!
+
+            return self
 
+        if mpt is None and ancestors:  self.enforce(False, 'Only one Feature per file')
+        if mpt in ancestors:  self.adopt(ancestors[mpt])
+        for klass in self.__class__.__mro__:  ancestors[klass] = self  #  the latest node of each kind
         return self
 
-    def my_class_name(self):  return re.sub(r'.*\.', '', str(self.__class__))
+    def adopt(self, parent):
+        parent.steps.append(self)  #  TODO  squeek if can't find parent
+        self.parent = parent
+
+    def my_class_name(self):  return self.__class__.__name__
     def prefix(self):  return ''
     def my_parent_type(self):  return None
 
@@ -53,11 +92,11 @@ class Morelia:
         name = self.i_look_like()
         return '\s*(' + name + '):?\s+(.*)'
 
-    def evaluate_steps(self, v):
-        v.visit(self)
-        for step in self.steps:  step.evaluate_steps(v)
+    def evaluate_steps(self, v, context = None):
+        v.visit(self, context)
+        for step in self.steps:  step.evaluate_steps(v, context)
 
-    def test_step(self, v):  pass
+    def test_step(self, v, context = None):  pass
     def i_look_like(self):  return self.my_class_name()
 
     def count_dimensions(self):  
@@ -66,6 +105,13 @@ class Morelia:
     def count_dimension(self):    # CONSIDER  beautify this crud!
         return 0
 
+    def table(self):  #  the title row, then the data rows, that fill in our <replitrons>
+        if self.steps != [] and self.steps[0].__class__ is Table:  return self.steps[0]
+        return self.steps
+
+    def schedule_html(self, strength):  return ''
+    def augment_predicate(self, row_indices = ()):  return self.predicate
+
     def validate_predicate(self):
         return  # looks good! (-:
         
@@ -96,16 +142,23 @@ class Morelia:
 
 
 class Viridis(Morelia):
+    __slots__ = ('binding',)  #  (suite class, step name, doc string regex, first character, the steps ahead of it)
+
+#  a parsed tree never changes while it runs - what a test case learns lives in its Context,
+#  and the binding only memoizes what any lookup would find again
 
     def prefix(self):  return '  '
 
-    def find_step_name(self, suite):
-        self.method = None
-        self.find_by_doc_string(suite)
-        if not self.method:  self.find_by_name(suite)
-        if self.method:  return self.method_name
+    def find_step_name(self, suite, row_indices = ()):
+        return self.find_step(suite, row_indices)[0]
+
+    def find_step(self, suite, row_indices = ()):  #  the (step method name, its arguments) to run
+        found = self.rebind(suite, row_indices) or \
+                self.find_by_doc_string(suite, row_indices) or \
+                self.find_by_name(suite)
+        if found:  return found
         doc_string = self.suggest_doc_string()
-        arguments = '(self' + self.extra_arguments + ')'  #  note this line ain't tested! C-:
+        arguments = '(self' + self.suggest_arguments() + ')'  #  note this line ain't tested! C-:
         method_name = 'step_' + re.sub('[^\w]+', '_', self.predicate)
 
         diagnostic = 'Cannot match step: ' + self.predicate + '\n' + \
@@ -117,85 +170,256 @@ class Viridis(Morelia):
         suite.fail(diagnostic)
 
     def suggest_doc_string(self, predicate = None):  #  CONSIDER  invent Ruby scan here, to dazzle the natives
-        self.extra_arguments = ''
         if not predicate:  predicate = self.predicate
         predicate = predicate.replace("'", "\\'")
         predicate = predicate.replace('\n', '\\n')
-        self._add_extra_args(r'\<(.+?)\>', predicate)
         predicate = re.sub(r'\<.+?\>', '(.+)', predicate)
-        self._add_extra_args(r'"(.+?)"', predicate)
         predicate = re.sub(r'".+?"', '"([^"]+)"', predicate)
         predicate = re.sub(r' \s+', '\\s+', predicate)
         predicate = predicate.replace('\n', '\\n')
         return "r'" + predicate + "'"
 
-    def _add_extra_args(self, matcher, predicate):
-        args = re.findall(matcher, predicate)
-        for arg in args:  self.extra_arguments += ', ' + arg
+    def suggest_arguments(self, predicate = None):  #  the arguments the suggested doc string captures
+        if not predicate:  predicate = self.predicate
+        predicate = predicate.replace("'", "\\'")
+        predicate = predicate.replace('\n', '\\n')
+        args = re.findall(r'\<(.+?)\>', predicate)
+        args += re.findall(r'"(.+?)"', re.sub(r'\<.+?\>', '(.+)', predicate))
+        return ''.join([', ' + arg for arg in args])
 
     def find_by_name(self, suite):
-        self.method_name = None
-        clean = re.sub(r'[^\w]', '_?', self.predicate)
-        self.matches = []
+        registry = StepRegistry.of(suite)
+        name = 'step_' + re.sub(r'[^\w]', '_', self.predicate)
 
-        for s in self.find_steps(suite, '^step_' + clean + '$'):  #  NOTE  the ^$ ain't tested
-            self.method_name = s
-            self.method = suite.__getattribute__(s)
-            return
+        if name in registry.methods:
+            found = [name]
+        else:
+            clean = re.sub(r'[^\w]', '_?', self.predicate)
+            found = self.find_steps(suite, '^step_' + clean + '$')  #  NOTE  the ^$ ain't tested
+
+        for s in found:
+            self.binding = (suite.__class__, s, None, '', ())
+            return s, ()
+
+    def rebind(self, suite, row_indices = ()):  #  a row reuses the step method an earlier row found,
+        if not self.binding or self.binding[0] is not suite.__class__:  return None
+        klass, s, doc, key, ahead = self.binding  #  unless a more specific one matches this row
+        predicate = self.augment_predicate(row_indices)
+
+        if doc:
+            if predicate[:1] != key:  return None  #  another bucket of candidates
+
+            for prefix, other, regex in ahead:
+                if predicate.startswith(prefix) and regex.match(predicate):  return None
 
-    def find_by_doc_string(self, suite):
-        self.method_name = None
+            m = doc.match(predicate)
+            if not m:  return None
+            return s, m.groups()
+        elif predicate != self.predicate:
+            return None  #  another row might match a doc string
 
-        for s in self.find_steps(suite, '^step_'):
-            self.method_name = s
-            method = suite.__getattribute__(s)
-            doc = method.__doc__
+        return s, ()
 
-            if doc:
-                doc = re.compile('^' + doc + '$')  #  CONSIDER deal with users who put in the ^$
-                m = doc.match(self.augment_predicate())
+    def find_by_doc_string(self, suite, row_indices = ()):
+        predicate = self.augment_predicate(row_indices)
+        candidates = StepRegistry.of(suite).candidates(predicate)
 
-                if m:
-                    self.matches = m.groups()
-                    self.method = method
-                    return
+        for at, (prefix, s, doc) in enumerate(candidates):
+            m = predicate.startswith(prefix) and doc.match(predicate)
+
+            if m:
+                self.binding = (suite.__class__, s, doc, predicate[:1], tuple(candidates[:at]))
+                return s, m.groups()
 
     def find_steps(self, suite, regexp):
         matcher = re.compile(regexp)
         list = []
         
-        for s in dir(suite):
+        for s in StepRegistry.of(suite).names:
             if matcher.match(s):  list.append(s)
 
         return list
 
     def evaluate(self, suite):
-        self.find_step_name(suite)
-        self.method(*self.matches)
+        name, matches = self.find_step(suite)
+        suite.__getattribute__(name)(*matches)
+
+
+class StepRegistry:  #  the step_ methods of one suite class, scanned once
+    _registries = {}
+
+    def __init__(self, klass):
+        self.names = [s for s in dir(klass) if s.startswith('step_')]
+        self.methods = set(self.names)
+        self.buckets = {}  #  first character of a doc string's literal prefix -> its steps
+        self.unprefixed = []
+        self._candidates = {}
+
+        for s in self.names:
+            doc = getattr(klass, s).__doc__
+            if doc:  #  CONSIDER deal with users who put in the ^$
+                regex = re.compile('^' + doc + '$')
+                prefix = _literal_prefix(doc)
+                entry = (prefix, s, regex)
+                if prefix:  self.buckets.setdefault(prefix[0], []).append(entry)
+                else:  self.unprefixed.append(entry)
+
+    def candidates(self, predicate):  #  the steps that might match, most specific first
+        key = predicate[:1]
+        if key in self._candidates:  return self._candidates[key]
+
+#  when several doc strings match one predicate, the one with the longest literal prefix
+#  wins, and ties go to the step name that sorts first (as dir() used to decide)
+
+        found = self.buckets.get(key, []) + self.unprefixed
+        found.sort(key=lambda entry: (-len(entry[0]), entry[1]))
+        self._candidates[key] = found
+        return found
+
+    @staticmethod
+    def of(suite):  #  a changed (or reloaded) class is a new key, so it gets a new registry
+        klass = suite.__class__
+        registry = StepRegistry._registries.get(klass)
+
+        if registry is None:
+            registry = StepRegistry._registries[klass] = StepRegistry(klass)
+
+        return registry
 
 
 class Parser:  
+    _lexers = {}
+
     def __init__(self):  
         self.thangs = [ Feature, Scenario,
                                     Step, Given, When, Then, And,
-                                       Row, Comment ]
+                                       Row, Table, Comment ]
         self.steps = []
+        self.ancestors = {}  #  node class -> the latest node of that class, for _parse to link to
+        self.results = []  #  the Results of the last evaluate
+
+    def parse_file(self, filename, cache = None):  #  cache is a directory to keep parsed trees in
+        source = open(filename, 'r')
+
+        try:  #  map the file, so we never hold its whole text as well as its tree
+            prose = mmap.mmap(source.fileno(), 0, access = mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            prose = source.read()  #  empty, or not a regular file
+
+        try:
+            key = cache and self.cache_key(prose)
+
+            if not cache or not self.load_cache(cache, filename, key):
+                self.parse_features(prose)
+                if cache:  self.save_cache(cache, filename, key)
+        finally:
+            if prose.__class__ is mmap.mmap:  prose.close()
+            source.close()
 
-    def parse_file(self, filename):
-        prose = open(filename, 'r').read()
-        self.parse_features(prose)
         self.steps[0].filename = filename
         return self
 
+    def cache_key(self, prose):  #  new prose, a new Morelia, or new thangs, mean a new tree
+        names = ' '.join([klass.__name__ for klass in self.thangs])
+        key = hashlib.sha1('%s\n%s\n' % (__version__, names))
+        key.update(prose)
+        return key.hexdigest()
+
+    def cache_path(self, cache, filename):
+        name = hashlib.sha1(os.path.abspath(filename)).hexdigest()
+        return os.path.join(cache, name + '.pickle')
+
+    def load_cache(self, cache, filename, key):
+        try:
+            stored, steps = cPickle.load(open(self.cache_path(cache, filename), 'rb'))
+        except Exception:
+            return False  #  missing, or corrupt, or from a Morelia that can't read it
+
+        if stored != key:  return False
+        self.steps = steps
+        return True
+
+    def save_cache(self, cache, filename, key):
+        if not os.path.isdir(cache):  os.makedirs(cache)
+        dump = lambda out:  cPickle.dump((key, self.steps), out, cPickle.HIGHEST_PROTOCOL)
+        _write_atomically(self.cache_path(cache, filename), dump)
+
     def parse_features(self, prose):
         self.parse_feature(prose)
         return self
 
-    def evaluate(self, suite):
-        self.rip(TestVisitor(suite))  #  CONSIDER  rename to Viridis
+    def evaluate(self, suite, strength = None, processes = None, threads = None, instruments = (), 
+                       profile = None, keep_going = False, fail_fast = False, last_run = None, rerun = False,
+                       impact = None, shard = None):
+        #  strength=2 runs a pairwise schedule; processes or threads run test cases concurrently;
+        #  profile names a file to dump pstats of each feature line's cost into; keep_going runs
+        #  every case, then raises all their faults at once; fail_fast stops a pool at the first
+        #  fault any worker finds, not the first in schedule order; last_run names a file that
+        #  remembers each case's status, and rerun skips the cases it says passed; impact names
+        #  a file mapping Scenarios to their step methods, and skips Scenarios nothing changed;
+        #  shard='3/8' runs only the third of eight slices of the cases, balanced by last_run's
+        #  durations - or pass a Shard built over every feature file, to balance them all at once
+        if keep_going and fail_fast:  raise ValueError('keep_going and fail_fast contradict each other')
+        history = impacts = None
+        selects = []
+
+        if last_run:
+            history = LastRun(last_run)
+            if rerun:  selects.append(history.unpassed)
+
+        if impact:
+            impacts = ImpactMap(impact, suite)
+            selects.append(impacts.impacted)
+            instruments = list(instruments) + [impacts]
+
+        if shard:
+            if isinstance(shard, basestring):  shard = Shard(shard, [self], suite, strength, last_run)
+            selects.append(shard.selects)
+
+        select = _select_every(selects)
+
+        if profile:
+            profiler = FeatureProfiler()
+            instruments = list(instruments) + [profiler]
+
+        if (processes or threads) and self.steps != []:
+            visitor = PoolVisitor(suite, self.steps[0], processes, strength, threads, instruments,
+                                  keep_going, fail_fast, select)
+        else:
+            visitor = TestVisitor(suite, strength, instruments, keep_going, select)  #  CONSIDER  rename to Viridis
+
+        try:
+            self.rip(visitor)
+            visitor.run()
+        finally:
+            self.results = visitor.results
+            if profile:  profiler.dump_stats(profile)
+
+            if history:
+                history.record(self.results)
+                history.save()
 
-    def report(self, suite):
-        rv = ReportVisitor(suite)
+            if impacts:
+                impacts.record(self.results)
+                impacts.save()
+
+        return self.results
+
+    def rerun(self, suite, last_run, **options):  #  only the cases that failed, or never ran, last time
+        return self.evaluate(suite, last_run = last_run, rerun = True, **options)
+
+    def cases(self, suite, strength = None):  #  the key of every test case evaluate would run, without running them
+        visitor = CaseVisitor(suite, strength)
+        self.rip(visitor)
+        return visitor.cases
+
+    def report_results(self, stream = None):  #  the Results of the last evaluate, case by case
+        report = ResultReport(self.results)
+        if stream:  return report.write(stream)
+        return str(report)
+
+    def report(self, suite, strength = None, stream = None):  #  a stream gets each node as it goes
+        rv = ReportVisitor(suite, strength, stream)
         self.rip(rv)
         return str(rv)
 
@@ -203,10 +427,10 @@ class Parser:
         if self.steps != []:
             self.steps[0].evaluate_steps(v)
 
-    def parse_feature(self, lines):
+    def parse_feature(self, lines):  #  prose, or a file, mmap, or other iterable of lines
         self.line_number = 0
 
-        for self.line in lines.split('\n'):
+        for self.line in _split_lines(lines):
             self.line_number += 1
             
             if not self.anneal_last_broken_line() and \
@@ -239,20 +463,36 @@ class Parser:
 
     def _parse_line(self):
         self.line = self.line.rstrip()
-        
-        for klass in self.thangs:
+        lexer, owners = self._lexer()
+        m = lexer.match(self.line)
+
+        if m:
+            klass, first, last = owners[m.lastindex]
             self.thang = klass()
-            rx = self.thang._my_regex()
-            m = re.compile(rx).match(self.line)
+            return self._register_line(m.groups()[first - 1:last])
 
-            if m and len(m.groups()) > 0:
-                return self._register_line(m.groups())
+    def _lexer(self):  #  compile all the thangs into one alternation, once
+        key = tuple(self.thangs)
+        if key in Parser._lexers:  return Parser._lexers[key]
+        regices = []
+        owners = {}
+        first = 1
+
+        for klass in self.thangs:
+            rx = klass()._my_regex()
+            last = first + re.compile(rx).groups - 1
+            for group in range(first, last + 1):  owners[group] = (klass, first, last)
+            regices.append('(?:' + rx + ')')
+            first = last + 1
+
+        Parser._lexers[key] = re.compile('|'.join(regices)), owners
+        return Parser._lexers[key]
 
     def _register_line(self, groups):
         predicate = ''
         if len(groups) > 1:  predicate = groups[1]
         node = self.thang
-        node._parse(predicate, self.steps, self.line_number)
+        node._parse(predicate, self.steps, self.line_number, self.ancestors)
         self.steps.append(node)
         self.last_node = node
         return node
@@ -265,86 +505,723 @@ class Parser:
 
 
 class ReportVisitor:
-    def __init__(self, suite):  self.suite = suite
-    string = ''
+    def __init__(self, suite, strength = None, stream = None):
+        self.suite = suite
+        self.strength = strength
+        self.stream = stream  #  without one, we hold the chunks until __str__ joins them
+        self.chunks = []
 
     def permute_schedule(self, node):  return [[0]]
     def step_schedule(self, node):  return [ [ x for x in range(len(node.steps)) ] ]
+    def selects(self, scenario, step_indices, row_indices):  return True
 
-    def visit(self, node):
+    def visit(self, node, context = None):
         recon, we_owe =  node.to_html()
         if recon[-1] != '\n':  recon += '\n'  #  TODO  clean this outa def reconstruction(s)!
-        self.string += recon
+        if self.strength:  recon += node.schedule_html(self.strength)
+        self.write(recon)
         return we_owe
 
-    def owed(self, owed):  self.string += owed
+    def owed(self, owed):  self.write(owed)
+    def notify(self, hook, *args):  pass
+
+    def write(self, chunk):
+        if self.stream:  self.stream.write(chunk)
+        else:  self.chunks.append(chunk)
+
+    def test_case(self, scenario, step_indices, row_indices):
+        scenario.evaluate_test_case(self, Context(self.suite, row_indices), step_indices)
         
     def __str__(self):
-        return self.string
+        return ''.join(self.chunks)
 
 
 class TestVisitor:
-    def __init__(self, suite):  self.suite = suite
-
-    def permute_schedule(self, node):  return node.permute_schedule()
+    def __init__(self, suite, strength = None, instruments = (), keep_going = False, select = None):
+        self.suite = suite
+        self.strength = strength  #  None runs every row combination
+        self.instruments = instruments
+        self.keep_going = keep_going  #  a failing case skips its own remaining steps, not the other cases
+        self.select = select  #  called with (scenario, step indices, row indices) - False skips that case
+        self.results = []
+
+    def permute_schedule(self, node):  return node.permute_schedule(self.strength)
     def step_schedule(self, node):  return node.step_schedule()
 
-    def visit(self, node):
+    def selects(self, scenario, step_indices, row_indices):
+        return not self.select or self.select(scenario, step_indices, row_indices)
+
+    def visit(self, node, context = None):
         # print node.reconstruction()  # CONSIDER  if verbose
-        self.suite.step = node
-        node.test_step(self)
+        suite = self.suite
+        if context:  suite = context.suite
+        suite.step = node
+        node.test_step(self, context)
 
     def owed(self, igme):  pass
+    def run(self):  self.raise_failures()  #  we ran each test case as we visited it
+
+    def raise_failures(self):
+        failures = [result for result in self.results if result.status != 'pass']
+
+        if self.keep_going and failures:
+            faults = ''.join(['\n' + result.fault.lstrip('\n') for result in failures])
+            raise AssertionError('%i of %i test cases failed:%s' % (len(failures), len(self.results), faults))
+
+    def notify(self, hook, *args):
+        for instrument in self.instruments:  getattr(instrument, hook)(*args)
+
+    def test_case(self, scenario, step_indices, row_indices):
+        result = Result(scenario, step_indices, row_indices)
+        self.results.append(result)
+        self.notify('before_case', scenario, row_indices)
+        start = time.time()
+
+        try:
+            scenario.evaluate_test_case(self, Context(self.suite, row_indices), step_indices)
+            result.status = 'pass'
+        except:
+            result.status = 'fail'
+            result.fault = str(sys.exc_info()[1])
+            if not self.keep_going or not isinstance(sys.exc_info()[1], Exception):  raise
+        finally:
+            result.duration = time.time() - start
+            self.notify('after_case', scenario, row_indices, result)
+
+
+class Instrument:  #  hooks around each moment of a test run - override the ones you need
+    def before_case(self, scenario, row_indices):  pass
+    def after_case(self, scenario, row_indices, result):  pass
+    def before_resolve(self, step, context):  pass
+    def after_resolve(self, step, context):  pass
+    def before_step(self, step, context):  pass
+    def after_step(self, step, context):  pass
+    def before_setUp(self, scenario):  pass
+    def after_setUp(self, scenario):  pass
+    def before_tearDown(self, scenario):  pass
+    def after_tearDown(self, scenario):  pass
+
+#  worker processes run their cases with forks of the instruments, and send them home to merge
+
+    def fork(self):  return self
+    def merge(self, forked):  pass
+
+
+class TimingCollector(Instrument):  #  latency histograms for each step definition
+    def __init__(self):
+        self.samples = {}  #  step method name, (resolve), (setUp), or (tearDown) -> seconds
+        self.started = {}
+
+    def start(self, what):
+        self.started[threading.currentThread(), what] = time.time()
+
+    def stop(self, what, name):
+        elapsed = time.time() - self.started.pop((threading.currentThread(), what))
+        self.samples.setdefault(name, []).append(elapsed)
+
+    def before_resolve(self, step, context):  self.start('resolve')
+    def after_resolve(self, step, context):  self.stop('resolve', '(resolve)')
+    def before_step(self, step, context):  self.start('step')
+    def after_step(self, step, context):  self.stop('step', context.method_name or step.predicate)
+    def before_setUp(self, scenario):  self.start('setUp')
+    def after_setUp(self, scenario):  self.stop('setUp', '(setUp)')
+    def before_tearDown(self, scenario):  self.start('tearDown')
+    def after_tearDown(self, scenario):  self.stop('tearDown', '(tearDown)')
+
+    def fork(self):  return TimingCollector()
+
+    def merge(self, forked):
+        for name, samples in forked.samples.items():
+            self.samples.setdefault(name, []).extend(samples)
+
+    def histogram(self, name):  #  count, p50, p95, max, and total seconds
+        samples = sorted(self.samples[name])
+        return (len(samples), _percentile(samples, 50), _percentile(samples, 95), 
+                samples[-1], sum(samples))
+
+    def slowest(self, n = 10):  #  the names that cost the most time in total
+        totals = [(-sum(samples), name) for name, samples in self.samples.items()]
+        return [name for total, name in sorted(totals)[:n]]
+
+    def report(self, n = 10):
+        lines = ['%8s %10s %10s %10s %10s  %s' % ('count', 'p50', 'p95', 'max', 'total', 'step')]
+
+        for name in self.slowest(n):
+            lines.append('%8i %10.6f %10.6f %10.6f %10.6f  %s' % (self.histogram(name) + (name,)))
+
+        return '\n'.join(lines) + '\n'
+
+
+class Context(object):  #  what one test case knows as it runs, so the tree it runs never changes
+    __slots__ = ('suite', 'row_indices', 'method_name', 'matches')
+
+    def __init__(self, suite, row_indices = ()):
+        self.suite = suite  #  the test case's own suite instance, once its Scenario makes one
+        self.row_indices = row_indices  #  which row of each step's table this case reads
+        self.method_name = None  #  the step method the current step resolved to
+        self.matches = ()
+
+
+class Result:  #  what one test case did, as plain data, so worker processes can send it home
+    def __init__(self, scenario, step_indices, row_indices):
+        self.path = _node_path(scenario)
+        self.filename = scenario.get_filename()
+        self.line_number = scenario.line_number
+        self.scenario = scenario.predicate
+        self.step_indices = step_indices
+        self.row_indices = row_indices
+        self.steps = [ (step.concept, step.augment_predicate(row_indices)) for idx, step in enumerate(scenario.steps)
+                       if step_indices == None or idx in step_indices ]
+        self.status = None
+        self.fault = None
+        self.duration = 0.0
+
+
+class ResultReport:  #  the Results of a run, rendered once per test case
+    def __init__(self, results):  self.results = results
+
+    def write(self, stream):
+        for chunk in self.chunks():  stream.write(chunk)
+
+    def __str__(self):
+        return ''.join(self.chunks())
+
+    def chunks(self):
+        total = sum([result.duration for result in self.results]) or 1.0
+        scenarios = []
+
+        for result in self.results:
+            if scenarios == [] or scenarios[-1][0].path != result.path:  scenarios.append([])
+            scenarios[-1].append(result)
+
+        for results in scenarios:
+            seconds = sum([result.duration for result in results])
+            failed = len([result for result in results if result.status != 'pass'])
+            yield _RESULTS_SCENARIO_HTML % { 'scenario': _clean_html(results[0].scenario),
+                                             'line_number': results[0].line_number,
+                                             'passed': len(results) - failed, 'failed': failed,
+                                             'seconds': seconds, 'share': 100.0 * seconds / total }
+
+            for result in results:
+                steps = ''.join([ _RESULT_STEP_HTML % (concept, _clean_html(predicate)) 
+                                  for concept, predicate in result.steps ])
+                fault = ''
+                if result.fault:  fault = _RESULT_FAULT_HTML % _clean_html(result.fault)
+                yield _RESULT_HTML % { 'color': _RESULT_COLORS.get(result.status, 'silver'),
+                                       'status': result.status, 'milliseconds': 1000 * result.duration,
+                                       'rows': ', '.join([str(x) for x in result.row_indices]),
+                                       'steps': steps, 'fault': fault }
+
+            yield '</table></div>\n'
+
+
+class LastRun:  #  each test case's status and duration, kept in a file between runs
+    def __init__(self, filename):
+        self.filename = filename
+        self.cases = {}  #  (feature file, Scenario line, step indices, row indices) -> (status, seconds)
+        self.features = {}  #  feature file -> hash of its contents, when its cases ran
+
+        try:
+            import json
+            stored = json.load(open(filename))
+        except (IOError, ValueError):
+            stored = {}  #  no last run yet, or one we can't read
+
+        if not isinstance(stored, dict):  stored = {}  #  from before we kept the features' hashes
+
+        for feature, digest in stored.get('features', {}).items():
+            if digest == _file_hash(feature):  self.features[feature] = digest
+
+        for record in stored.get('cases', []):
+            feature = record['file']
+            if feature and feature not in self.features:  continue  #  it changed, so its Scenarios may have moved
+            key = self.key(feature, record['line'], record['steps'], record['rows'])
+            self.cases[key] = (record['status'], record['duration'])
+
+    def key(self, filename, line_number, step_indices, row_indices):
+        return _case_key(filename, line_number, step_indices, row_indices)
+
+    def case(self, scenario, step_indices, row_indices):  #  what the last run knew of one case, or None
+        return self.cases.get(self.key(scenario.get_filename(), scenario.line_number, step_indices, row_indices))
+
+    def unpassed(self, scenario, step_indices, row_indices):
+        case = self.case(scenario, step_indices, row_indices)
+        return not case or case[0] != 'pass'
+
+    def record(self, results):
+        for result in results:
+            if result.status in ('pass', 'fail'):
+                key = self.key(result.filename, result.line_number, result.step_indices, result.row_indices)
+                self.cases[key] = (result.status, result.duration)
+
+        for feature in set([key[0] for key in self.cases]):
+            if feature and feature not in self.features:  self.features[feature] = _file_hash(feature)
+
+    def save(self):
+        import json
+        records = [ { 'file': filename, 'line': line_number, 'steps': list(steps), 'rows': list(rows),
+                      'status': status, 'duration': round(duration, 6) }
+                    for (filename, line_number, steps, rows), (status, duration) in sorted(self.cases.items()) ]
+        stored = { 'features': self.features, 'cases': records }
+        _write_atomically(self.filename, lambda out:  json.dump(stored, out, separators = (',', ':'), sort_keys = True))
+
+
+class Shard:  #  one of N slices of some features' test cases, balanced by how long each took last time
+    def __init__(self, shard, parsers, suite, strength = None, last_run = None):
+        self.index, self.count = _parse_shard(shard)  #  '3/8' is the third of eight shards
+        cases = []
+        for parser in parsers:  cases.extend(parser.cases(suite, strength))
+        history = None
+        if last_run:  history = LastRun(last_run)
+        shards = _partition(cases, self.costs(cases, history), self.count)
+        self.cases = shards[self.index - 1]
+        self.keys = set(self.cases)
+
+    def costs(self, cases, history):  #  last run's seconds; new cases cost the mean; no history counts cases
+        known = [history.cases[case][1] for case in cases if history and case in history.cases]
+        if not known:  return [1.0] * len(cases)
+        mean = sum(known) / len(known)
+        return [history.cases.get(case, (None, mean))[1] for case in cases]
+
+    def selects(self, scenario, step_indices, row_indices):
+        return _case_key(scenario.get_filename(), scenario.line_number, step_indices, row_indices) in self.keys
+
+
+class ImpactMap(Instrument):  #  which step methods each Scenario ran, and the sources they came from
+    def __init__(self, filename = None, suite = None):
+        self.filename = filename
+        self.suite = suite
+        self.features = {}  #  feature file -> hash of its contents, as of the last run
+        self.methods = {}  #  Suite.step_method -> hash of its source, as of the last run
+        self.scenarios = {}  #  (feature file, Scenario line) -> the step methods its cases called
+        self.bound = {}  #  the same, for the Scenarios of this run
+        self.tables = {}  #  (feature file, Scenario line) -> { Table file: hash of its rows, as of the last run }
+        self.read = {}  #  (feature file, Scenario line) -> the Table files it reads in this run
+        self.hashes = {}  #  feature files, Table files, and step methods -> hashes of what they hold now
+        self.verdicts = {}  #  (feature file, Scenario line) -> whether this run should run it
+
+        try:
+            import json
+            stored = json.load(open(filename))
+        except (IOError, ValueError, TypeError):
+            stored = {}  #  no map yet, or one we can't read
+
+        self.features = stored.get('features', {})
+        self.methods = stored.get('methods', {})
+
+        for record in stored.get('scenarios', []):
+            self.scenarios[record['file'], record['line']] = record['methods']
+            self.tables[record['file'], record['line']] = record.get('tables', {})
+
+    def key(self, filename, line_number):
+        if filename:  filename = os.path.abspath(filename)
+        return filename, line_number
+
+    def after_step(self, step, context):
+        key = self.key(step.get_filename(), step.parent.line_number)
+        self.bound.setdefault(key, set()).add(self.method_key(context.method_name))
+
+    def method_key(self, name):
+        return '%s.%s' % (self.suite.__class__.__name__, name)
+
+    def fixtures(self):  #  every Scenario calls these
+        return [self.method_key('setUp'), self.method_key('tearDown')]
+
+    def fork(self):  return ImpactMap(None, self.suite)
+
+    def merge(self, forked):
+        for key, methods in forked.bound.items():  self.bound.setdefault(key, set()).update(methods)
+
+    def feature_hash(self, filename):
+        if filename not in self.hashes:  self.hashes[filename] = _file_hash(filename)
+        return self.hashes[filename]
+
+    def method_hash(self, key):
+        if key not in self.hashes:
+            try:
+                method = getattr(self.suite.__class__, key.split('.', 1)[1])
+                self.hashes[key] = hashlib.sha1(inspect.getsource(method)).hexdigest()
+            except (AttributeError, IOError, TypeError):
+                self.hashes[key] = None
+
+        return self.hashes[key]
+
+    def impacted(self, scenario, step_indices, row_indices):  #  run a Scenario unless nothing it uses changed
+        key = self.key(scenario.get_filename(), scenario.line_number)
+        if key in self.verdicts:  return self.verdicts[key]
+        filename, line_number = key
+        methods = self.scenarios.get(key)
+        self.read[key] = scenario.table_paths()
+        verdict = True
+
+        if methods is not None and filename:
+            now = self.feature_hash(filename)
+            verdict = now is None or now != self.features.get(filename)
+            for method in methods + self.fixtures():
+                now = self.method_hash(method)
+                if now is None or now != self.methods.get(method):  verdict = True
+            for table, digest in self.tables.get(key, {}).items():
+                now = self.feature_hash(table)
+                if now is None or now != digest:  verdict = True
+
+        self.verdicts[key] = verdict
+        return verdict
+
+    def record(self, results):  #  only Scenarios whose every case passed may be skipped next time
+        passed = {}
+
+        for result in results:
+            key = self.key(result.filename, result.line_number)
+            passed[key] = passed.get(key, True) and result.status == 'pass'
+
+        for filename in set([filename for filename, line_number in passed]):
+            if filename and self.feature_hash(filename) != self.features.get(filename):
+                for key in [key for key in self.scenarios if key[0] == filename]:
+                    del self.scenarios[key]  #  its Scenarios may have moved to other lines
+                    self.tables.pop(key, None)
+
+                self.features[filename] = self.feature_hash(filename)
+
+        for key, ok in passed.items():
+            if not ok or not key[0]:
+                self.scenarios.pop(key, None)
+                self.tables.pop(key, None)
+                continue
+
+            self.scenarios[key] = sorted(self.bound.get(key, ()))
+            self.tables[key] = dict([(table, self.feature_hash(table)) for table in self.read.get(key, ())])
+            for method in self.scenarios[key] + self.fixtures():  self.methods[method] = self.method_hash(method)
+
+    def save(self):
+        import json
+        stored = { 'features': self.features, 'methods': self.methods,
+                   'scenarios': [ { 'file': filename, 'line': line_number, 'methods': methods,
+                                    'tables': self.tables.get((filename, line_number), {}) }
+                                  for (filename, line_number), methods in sorted(self.scenarios.items()) ] }
+        _write_atomically(self.filename, lambda out:  json.dump(stored, out, separators = (',', ':'), sort_keys = True))
+
+
+class Watcher:  #  keeps feature trees and step classes alive, and reruns the Scenarios each edit touches
+    def __init__(self, suite, filenames, interval = 1, cache = None, impact = None, stream = None):
+        self.suite = suite
+        self.filenames = list(filenames)
+        self.interval = interval  #  seconds between looks, when inotify can't wake us
+        self.cache = cache  #  a parse cache directory, if any
+        self.stream = stream or sys.stdout
+
+        if not impact:  #  without a map of our own, start from scratch in a private one
+            handle, impact = tempfile.mkstemp('.json', 'morelia-')
+            os.close(handle)
+
+        self.impact = impact
+        self.trees = {}  #  feature file -> its Parser, parsed once and again only when it changes
+        self.stats = {}  #  watched file -> (mtime, size) when we last looked
+        self.notifier = None
+
+        for filename in self.filenames:  self.parse(filename)
+        self.poll()
+
+    def modules(self):  #  the step module we can reload - not __main__, which never reloads cleanly
+        module = sys.modules.get(self.suite.__class__.__module__)
+        if module and module.__name__ != '__main__' and getattr(module, '__file__', None):  return [module]
+        return []
+
+    def tables(self):  #  Table file -> the Table nodes, in every tree, that read it
+        found = {}
+
+        for tree in self.trees.values():
+            for node in tree.steps:
+                if isinstance(node, Table):  found.setdefault(os.path.abspath(node.table_path()), []).append(node)
+
+        return found
+
+    def watched(self):
+        return self.filenames + sorted(self.tables()) + \
+               [re.sub(r'\.py[co]$', '.py', module.__file__) for module in self.modules()]
+
+    def poll(self):  #  the watched files whose stat changed since last we looked
+        changed = []
+
+        for filename in self.watched():
+            try:
+                stat = os.stat(filename)
+                stat = (stat.st_mtime, stat.st_size)
+            except OSError:
+                stat = None
+
+            if self.stats.get(filename) != stat:  changed.append(filename)
+            self.stats[filename] = stat
+
+        return changed
+
+    def parse(self, filename):
+        try:
+            self.trees[filename] = Parser().parse_file(filename, self.cache)
+        except (SyntaxError, EnvironmentError), e:
+            self.trees.pop(filename, None)  #  we try again when it changes
+            self.stream.write('%s\n' % e)
+
+    def update(self, changed):  #  reload changed step modules, re-index changed Tables, re-parse changed features
+        for module in self.modules():
+            if re.sub(r'\.py[co]$', '.py', module.__file__) not in changed:  continue
+            klass = self.suite.__class__
+
+            try:
+                linecache.checkcache()  #  so inspect sees the new source
+                reload(module)
+                StepRegistry._registries.pop(klass, None)
+                self.suite = getattr(module, klass.__name__)(self.suite._testMethodName)
+            except Exception, e:  #  a half-written module - keep the old steps until it changes again
+                self.stream.write('%s\n' % e)
+
+        for table, nodes in self.tables().items():
+            if table in changed:
+                for node in nodes:  node.reindex()
+
+        for filename in self.filenames:
+            if filename in changed:  self.parse(filename)
+
+    def run(self):  #  the Results of every Scenario the changes touched
+        results = []
+
+        for filename in self.filenames:
+            if filename not in self.trees:  continue
+            tree = self.trees[filename]
+
+            try:
+                tree.evaluate(self.suite, impact = self.impact, keep_going = True)
+            except Exception, e:
+                self.stream.write('%s\n' % e)
+
+            results.extend(tree.results)
+
+        failed = len([result for result in results if result.status != 'pass'])
+        self.stream.write('%i cases ran, %i failed\n' % (len(results), failed))
+        return results
+
+    def wait(self):  #  sleeps until a watched file changes, and returns the changed ones
+        while True:
+            changed = self.poll()
+            if changed:  return changed
+
+            if self.notifier:
+                if self.notifier.check_events():
+                    self.notifier.read_events()
+                    self.notifier.process_events()
+            else:
+                time.sleep(self.interval)
+
+    def notify(self):  #  let inotify wake us, if pyinotify is installed - we stat the files either way
+        try:
+            import pyinotify
+        except ImportError:
+            return None
+
+        manager = pyinotify.WatchManager()
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | pyinotify.IN_CREATE
+
+        for folder in set([os.path.dirname(os.path.abspath(filename)) for filename in self.watched()]):
+            manager.add_watch(folder, mask)
+
+        return pyinotify.Notifier(manager, timeout = self.interval * 1000)
+
+    def watch(self):  #  runs until interrupted
+        self.notifier = self.notify()
+        self.run()
+
+        while True:
+            self.update(self.wait())
+            self.run()
+
+
+class FeatureProfiler(Instrument):  #  the cost of each feature line, as pstats sees it
+    def __init__(self):
+        self.costs = {}  #  (filename, line_number, predicate) -> [calls, own time, cumulative time, callers]
+        self.started = {}
+        self.stats = {}
+
+    def key(self, node):
+        return ('%s' % node.get_filename(), node.line_number, 
+                node.concept + ': ' + node.predicate.replace('\n', '\\n'))
+
+    def before_case(self, scenario, row_indices):
+        self.started[threading.currentThread()] = [time.time(), 0.0, None]  #  case, its steps' time, step
+
+    def before_step(self, step, context):
+        case = self.started.get(threading.currentThread())
+        if case:  case[2] = time.time()
+
+    def after_step(self, step, context):
+        case = self.started.get(threading.currentThread())
+        if not case:  return
+        elapsed = time.time() - case[2]
+        case[1] += elapsed
+        self.add(self.key(step), elapsed, elapsed, self.key(step.parent))
+
+    def after_case(self, scenario, row_indices, result):
+        start, steps, step = self.started.pop(threading.currentThread())
+        elapsed = time.time() - start
+        self.add(self.key(scenario), elapsed - steps, elapsed)
+
+    def add(self, key, own, cumulative, caller = None):
+        _profile_lock.acquire()  #  a thread pool's workers share one profiler
+
+        try:
+            cost = self.costs.setdefault(key, [0, 0.0, 0.0, {}])
+            cost[0] += 1
+            cost[1] += own
+            cost[2] += cumulative
+
+            if caller:
+                calls = cost[3].setdefault(caller, [0, 0.0, 0.0])
+                calls[0] += 1
+                calls[1] += own
+                calls[2] += cumulative
+        finally:
+            _profile_lock.release()
+
+    def fork(self):  return FeatureProfiler()
+
+    def merge(self, forked):
+        for key, (calls, own, cumulative, callers) in forked.costs.items():
+            cost = self.costs.setdefault(key, [0, 0.0, 0.0, {}])
+            for idx, value in enumerate((calls, own, cumulative)):  cost[idx] += value
+
+            for caller, counts in callers.items():
+                total = cost[3].setdefault(caller, [0, 0.0, 0.0])
+                for idx, value in enumerate(counts):  total[idx] += value
+
+    def create_stats(self):  #  pstats.Stats(profiler) reads these, as it would from a cProfile.Profile
+        self.stats = {}
+
+        for key, (calls, own, cumulative, callers) in self.costs.items():
+            callers = dict([ (caller, (n, n, o, c)) for caller, (n, o, c) in callers.items() ])
+            self.stats[key] = (calls, calls, own, cumulative, callers)
+
+    def dump_stats(self, filename):
+        self.create_stats()
+        marshal.dump(self.stats, open(filename, 'wb'))
+
+    def report(self, sort = 'cumulative', n = 20):
+        stream = StringIO()
+        pstats.Stats(self, stream = stream).sort_stats(sort).print_stats(n)
+        return stream.getvalue()
+
+_profile_lock = threading.Lock()
+
+
+class PoolVisitor(TestVisitor):  #  collects the test cases, then farms them out to workers
+    def __init__(self, suite, root, processes, strength = None, threads = None, instruments = (),
+                       keep_going = False, fail_fast = False, select = None):
+        TestVisitor.__init__(self, suite, strength, instruments, keep_going, select)
+        self.root = root
+        self.processes = processes
+        self.threads = threads
+        self.fail_fast = fail_fast  #  take results as workers finish them, and stop at the first fault
+        self.cases = []
+
+    def test_case(self, scenario, step_indices, row_indices):
+        self.cases.append((_node_path(scenario), step_indices, row_indices))
+
+    def run(self):  #  the first failing case, in schedule order, raises here
+        imap = 'imap'
+        if self.fail_fast:  imap = 'imap_unordered'
+
+        if self.threads:  #  each case brings its own Context, so threads can share one tree
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(self.threads)
+            work = getattr(pool, imap)(self.evaluate_case, self.cases, self.chunksize(self.threads))
+        else:
+            import multiprocessing
+            args = (self.root, self.suite, self.instruments)
+            pool = multiprocessing.Pool(self.processes, _install_pool_case, args)
+            work = getattr(pool, imap)(_evaluate_pool_case, self.cases, self.chunksize(self.processes))
+
+        try:
+            for results, error, forks in work:
+                self.results.extend(results)
+                for instrument, forked in zip(self.instruments, forks):  instrument.merge(forked)
+                if error and not self.keep_going:  raise error
+
+            pool.close()
+        finally:
+            pool.terminate()  #  fail_fast's workers stop here, mid-schedule
+            pool.join()
+
+        self.raise_failures()
+
+    def chunksize(self, workers):  #  fail_fast hears of each case as soon as it ends
+        if self.fail_fast:  return 1
+        return max(1, len(self.cases) // (workers * 4))
+
+    def evaluate_case(self, case):  #  threads share our instruments
+        return _evaluate_cases(self.root, self.suite, [case], self.instruments) + ([],)
+
+
+class CaseVisitor(TestVisitor):  #  lists the test cases, so a Shard can split them before anyone runs them
+    def __init__(self, suite, strength = None):
+        TestVisitor.__init__(self, suite, strength)
+        self.cases = []
+
+    def test_case(self, scenario, step_indices, row_indices):
+        self.cases.append(_case_key(scenario.get_filename(), scenario.line_number, step_indices, row_indices))
 
 
 class Feature(Morelia):
+    __slots__ = ('filename',)
+
     def my_parent_type(self):  return None
         
-    def test_step(self, v):  
+    def test_step(self, v, context = None):  
         self.enforce(0 < len(self.steps), 'Feature without Scenario(s)')
 
     def to_html(self):
-        return ['\n<div><table><tr style="background-color: #aaffbb;" width="100%">' +
-                                  '<td align="right" valign="top" width="100">' + 
-                                  '<em>' + self.concept + '</em>:</td><td colspan="101">' + 
-                                    _clean_html(self.predicate) + '</td></tr></table></div>', '']
+        return [_FEATURE_HTML % (self.concept, _clean_html(self.predicate)), '']
 
 
 class Scenario(Morelia):
+    __slots__ = ()
+
     def my_parent_type(self):  return Feature
 
-    def evaluate_steps(self, visitor):
+    def evaluate_steps(self, visitor, context = None):
+        for step_indices, indices in self.test_cases(visitor):
+            visitor.test_case(self, step_indices, indices)  #  note this works on reports too!
+
+    def test_cases(self, visitor):  #  each (step indices, row indices) this Scenario runs, on demand
         step_schedule = visitor.step_schedule(self)  #  TODO  test this permuter directly (and rename it already)
 
         for step_indices in step_schedule:   #  TODO  think of a way to TDD this C-:
-            schedule = visitor.permute_schedule(self)
-
-            for indices in schedule:
-                self.row_indices = indices
-                self.evaluate_test_case(visitor, step_indices)  #  note this works on reports too!
+            for indices in visitor.permute_schedule(self):
+                if visitor.selects(self, step_indices, indices):  yield step_indices, indices
     
-    def evaluate_test_case(self, visitor, step_indices = None):  #  note this permutes reports too!
+    def evaluate_test_case(self, visitor, context, step_indices = None):  #  note this permutes reports too!
         self.enforce(0 < len(self.steps), 'Scenario without step(s) - Step, Given, When, Then, And, or #')
 
-        name = self.steps[0].find_step_name(visitor.suite)
-        visitor.suite = visitor.suite.__class__(name)
+        name = self.steps[0].find_step_name(context.suite, context.row_indices)
+        context.suite = context.suite.__class__(name)
         # print self.predicate  #  CONSIDER  if verbose
-        visitor.suite.setUp()
+        visitor.notify('before_setUp', self)
+        context.suite.setUp()
+        visitor.notify('after_setUp', self)
 
         try:
-            u_owe = visitor.visit(self)
+            u_owe = visitor.visit(self, context)
             
             for idx, step in enumerate(self.steps):  
                 if step_indices == None or idx in step_indices:  #  TODO  take out the default arg
-                    step.evaluate_steps(visitor)
+                    step.evaluate_steps(visitor, context)
                     
             visitor.owed(u_owe)
         finally:
-            visitor.suite.tearDown()
+            visitor.notify('before_tearDown', self)
+            context.suite.tearDown()
+            visitor.notify('after_tearDown', self)
 
-    def permute_schedule(self):  #  TODO  rename to permute_row_schedule
+    def permute_schedule(self, strength = None):  #  TODO  rename to permute_row_schedule
         dims = self.count_Row_dimensions()
-        return _permute_indices(dims)
+        if strength:  return _cover_indices(dims, strength)
+        return _iterate_indices(dims)
 
     def step_schedule(self):  #  TODO  rename to permute_step_schedule !
         sched = []
@@ -374,105 +1251,150 @@ class Scenario(Morelia):
         return sched
 
     def _embellish(self):
-        self.row_indices = []
+        row_indices = []
         
         for step in self.steps:
-            rowz = int(step.steps != [] and step.steps[0].__class__ is Row)
-            self.row_indices.append(rowz)
+            rowz = int(step.steps != [] and step.steps[0].__class__ in (Row, Table))
+            row_indices.append(rowz)
         
-        return self.row_indices.count(1) > 0
+        return row_indices.count(1) > 0
 
     def count_Row_dimensions(self):
         return [step.count_dimensions() for step in self.steps]
 
+    def table_paths(self):  #  the files our steps' Tables read their rows from
+        tables = [step.table() for step in self.steps]
+        return [os.path.abspath(table.table_path()) for table in tables if isinstance(table, Table)]
+
     def reconstruction(self):
         return '\n' + self.concept + ': ' + self.predicate
 
+    def schedule_html(self, strength):
+        dims = self.count_Row_dimensions()
+        total = reduce(lambda product, n:  product * len(_special_range(n)), dims, 1)  #  without listing them
+        if total < 2:  return ''
+        covered = _cover_count(dims, strength)
+        name = { 1: 'each row', 2: 'pairwise' }.get(strength, '%i-wise' % strength)
+        return '<tr><td></td><td colspan="101"><em>%s</em>: %i of %i row combinations</td></tr>\n' % \
+                    (name, covered, total)
+
     def to_html(self):
-        return ['\n<div><table width="100%"><tr style="background-color: #cdffb8;">' +
-                '<td align="right" valign="top" width="100"><em>' + self.concept + '</em>:</td><td colspan="101">' + \
-                                            _clean_html(self.predicate) + '</td></tr>', '</table></div>']
+        return [_SCENARIO_HTML % (self.concept, _clean_html(self.predicate)), '</table></div>']
 
 
 class Step(Viridis):
+    __slots__ = ('plan',)  #  (predicate, Table generation, its literal chunks and (table, column, name) references)
+
     def my_parent_type(self):  return Scenario
 
-    def test_step(self, v):
-        self.find_step_name(v.suite)
+    def test_step(self, v, context = None):
+        if not context:  context = Context(v.suite)  #  a step outside any Scenario runs on its visitor's suite
+        v.notify('before_resolve', self, context)
+
+        try:
+            context.method_name, context.matches = self.find_step(context.suite, context.row_indices)
+        finally:
+            v.notify('after_resolve', self, context)
 
 # ERGO  use "born again pagan" somewhere
 
+        v.notify('before_step', self, context)
+
         try:
-            self.method(*self.matches)
+            context.suite.__getattribute__(context.method_name)(*context.matches)
         except (Exception, SyntaxError), e:
             new_exception = self.format_fault(str(e))
             e.args = (new_exception,) + (e.args[1:])
             if type(e) == SyntaxError:  raise SyntaxError(new_exception)
             raise
+        finally:
+            v.notify('after_step', self, context)
 
-    def augment_predicate(self):  #  CONSIDER  unsucktacularize me pleeeeeeze
+    def augment_predicate(self, row_indices = ()):
         if self.parent == None:  return self.predicate
+        plan = self.substitution_plan()
+        if not plan:  return self.predicate
+        copy = []
+
+        for chunk in plan:
+            if chunk.__class__ is tuple:
+                chunk = self.replace_replitron(*chunk + (row_indices,))
+
+            copy.append(chunk)
+
+        return ''.join(copy)
+
+    def substitution_plan(self):  #  compile the <replitrons> once, not once per row -
+        if self.plan and self.plan[0] is self.predicate and self.plan[1] == Table.generation:  return self.plan[2]
+        plan = []
         dims = self.parent.count_Row_dimensions()
-        if set(dims) == set([0]):  return self.predicate
-        rep = re.compile(r'\<(\w+)\>')
-        replitrons = rep.findall(self.predicate)
-        if replitrons == []:  return self.predicate
-        self.copy = self.predicate[:]
-
-        for self.replitron in replitrons:
-            for x in range(0, len(self.parent.row_indices)):
-                self.table = self.parent.steps[x].steps
-            
-                if self.table != []:
-                    q = 0
 
-                    for self.title in self.table[0].harvest():
-                        self.replace_replitron(x, q)
-                        q += 1
+        if set(dims) != set([0]):
+            chunks = re.split(r'\<(\w+)\>', self.predicate)
+
+            for idx, chunk in enumerate(chunks):
+                if idx % 2:  chunk = self.find_replitron(chunk)
+                plan.append(chunk)
 
-        return self.copy
+        if len(plan) < 2:  plan = []
+        self.plan = (self.predicate, Table.generation, plan)  #  or again, when a Table's rows change
+        return plan
 
-    def replace_replitron(self, x, q):
-        if self.title != self.replitron:  return
-        at = self.parent.row_indices[x] + 1
+    def find_replitron(self, replitron):  #  CONSIDER  better diagnostics when we miss these
+        for x, step in enumerate(self.parent.steps):
+            table = step.table()
+            
+            if len(table):
+                q = table[0].column(replitron)
+                if q is not None:  return (x, q, replitron)
+
+        return '<' + replitron + '>'
+
+    def replace_replitron(self, x, q, replitron, row_indices):
+        if x >= len(row_indices):  return '<' + replitron + '>'
+        table = self.parent.steps[x].table()
+        at = row_indices[x] + 1
         
-        if at >= len(self.table):  
+        if at >= len(table):  
             print 'CONSIDER this should never happen'
-            return
-
-        #  CONSIDER  we hit this too many times - hit once and stash the result
-        #  CONSIDER  better diagnostics when we miss these
+            return '<' + replitron + '>'
 
-        stick = self.table[at].harvest()
+        stick = table[at].cells()
         found = stick[q]  #  CONSIDER  this array overrun is what you get when your table is ragged
             #  CONSIDER  only if it's not nothing?
-        found = found.replace('\n', '\\n')  #  CONSIDER  crack the multi-line argument bug, and take this hack out!
-        self.copy = self.copy.replace('<'+self.replitron+'>', found)
+        return found.replace('\n', '\\n')  #  CONSIDER  crack the multi-line argument bug, and take this hack out!
 
         # CONSIDER  mix replitrons and matchers!
 
     def to_html(self):
-        return '\n<tr><td align="right" valign="top"><em>' + self.concept + '</em></td><td colspan="101">' + _clean_html(self.predicate) + '</td></tr>', ''
+        return _STEP_HTML % (self.concept, _clean_html(self.predicate)), ''
 
 
 class Given(Step):   #  CONSIDER  distinguish these by fault signatures!
+    __slots__ = ()
     def prefix(self):  return '  '
         
-class When(Step):  #  TODO  cycle these against the Scenario
+class When(Step):
+    __slots__ = ()  #  TODO  cycle these against the Scenario
     def prefix(self):  return '   '
     def to_html(self):
-        return '\n<tr style="background-color: #cdffb8; background: url(http://www.zeroplayer.com/images/stuff/aqua_gradient.png) no-repeat; background-size: 100%;"><td align="right" valign="top"><em>' + self.concept + '</em></td><td colspan="101">' + _clean_html(self.predicate) + '</td></tr>', ''
+        return _WHEN_HTML % (self.concept, _clean_html(self.predicate)), ''
 
 class Then(Step):
+    __slots__ = ()
     def prefix(self):  return '   '
         
-class And(Step):  
+class And(Step):
+    __slots__ = ()  
     def prefix(self):  return '    '
 
 #  CONSIDER  how to validate that every row you think you wrote actually ran?
 
 
 class Row(Morelia):
+    __slots__ = ('parsed',  #  (predicate, its cells) - a Row splits itself once, not once per use
+                 'columns')  #  (cells, title -> column index)
+
     def i_look_like(self):  return r'\|'
     def my_parent_type(self):  return Step
     def prefix(self):  return '        '
@@ -494,8 +1416,8 @@ class Row(Morelia):
         else:
             color = '#ffffee'
         
-        for col in self.harvest():
-            html += '<td style="background-color: %s;"><%s>' % (color, em) + _clean_html(col) + '</%s></td>' % em
+        for col in self.cells():
+            html += _CELL_HTML % (color, em, _clean_html(col), em)
             
         html += '<td>&#160;</td></tr>'  #  CONSIDER  the table needn't stretch out so!
         return html, ''
@@ -505,14 +1427,203 @@ class Row(Morelia):
         return 1  #  TODO  raise an error (if the table has one row!)
 
     def harvest(self):
+        return list(self.cells())
+
+    def cells(self):
+        if self.parsed and self.parsed[0] is self.predicate:  return self.parsed[1]
         row = re.split(r' \|', re.sub(r'\|$', '', self.predicate))
-        row = [s.strip() for s in row]
+        row = tuple([s.strip() for s in row])
+        self.parsed = (self.predicate, row)
         return row
 
+    def column(self, title):  #  which column a title row gives that title, or None
+        cells = self.cells()
+
+        if not self.columns or self.columns[0] is not cells:
+            index = {}
+            for q, cell in enumerate(cells):  index.setdefault(cell, q)
+            self.columns = (cells, index)
+
+        return self.columns[1].get(title)
+
+class _TableRow(object):  #  one record of a Table, wearing the face of a Row
+    __slots__ = ('row',)
+
+    def __init__(self, row):  self.row = row
+    def cells(self):  return self.row
+    def harvest(self):  return list(self.row)
+
+    def column(self, title):
+        if title in self.row:  return self.row.index(title)
+        return None
+
+
+class Table(Morelia):  #  Table: zones.csv - the rows live in a file, and we read them as we need them
+    __slots__ = ('source',  #  (process id, open file) - forked workers must not share a file position
+                 'offsets',  #  where each record starts, so we can seek to any row without holding them all
+                 'last',  #  (index, cells) of the record read most recently
+                 'titles')  #  the keys of the first JSON object, when the records are objects
+    generation = 0  #  counts re-read Table files, so Steps know their substitution plans went stale
+
+    def i_look_like(self):  return 'Table'
+    def my_parent_type(self):  return Step
+    def prefix(self):  return '        '
+
+    def _my_regex(self):  #  the colon and extension are mandatory, so prose like "Table: of contents" stays prose
+        extensions = '|'.join([''.join(['[%s%s]' % (c, c.upper()) for c in extension])
+                                  for extension in ('csv', 'tsv', 'jsonl', 'ndjson')])
+        return '\s*(' + self.i_look_like() + '):\s*(\S.*\.(?:' + extensions + '))\s*$'
+
+    def validate_predicate(self):
+        self.enforce(self.predicate.count('\n') == 0, 'linefeed in Table file name')
+
+    def to_html(self):
+        html = '\n<tr><td></td><td colspan="101"><em>%s</em>: %s (%i rows)</td></tr>'
+        return html % (self.concept, _clean_html(self.predicate), self.count_dimension()), ''
+
+    def count_dimension(self):
+        return max(0, len(self) - 1)
+
+    def table_path(self):
+        folder = os.path.dirname(self.get_filename() or '')
+        return os.path.join(folder, self.predicate.strip())
+
+    def table_format(self):
+        extension = os.path.splitext(self.predicate.strip())[1].lower()
+        if extension in ('.jsonl', '.ndjson'):  return 'jsonl'
+        if extension == '.tsv':  return 'tsv'
+        self.enforce(extension == '.csv', 'Table files must be .csv, .tsv, .jsonl, or .ndjson')
+        return 'csv'
+
+    def open_source(self):
+        if not self.source or self.source[0] != os.getpid():
+            try:
+                self.source = (os.getpid(), open(self.table_path(), 'rb'))
+            except IOError, e:
+                self.enforce(False, str(e))
+
+        return self.source[1]
+
+    def __nonzero__(self):  return True  #  a node is a node, however few rows it has
+
+    def __len__(self):
+        if self.offsets is None:
+            _table_lock.acquire()
+
+            try:
+                if self.offsets is None:  self.offsets = self.index_records()
+            finally:
+                _table_lock.release()
+
+        return len(self.offsets)
+
+    def __getitem__(self, at):
+        if at < 0 or at >= len(self):  raise IndexError(at)
+        if at == 0 and self.titles:  return _TableRow(self.titles)
+        last = self.last
+        if last and last[0] == at:  return _TableRow(last[1])
+
+        _table_lock.acquire()  #  threads share our file, and its position
+
+        try:
+            source = self.open_source()
+            source.seek(self.offsets[at])
+            cells = self.record_cells(self.read_records(source).next()[1])
+        finally:
+            _table_lock.release()
+
+        self.last = (at, cells)
+        return _TableRow(cells)
+
+    def reindex(self):  #  the file changed - forget where its records were, and read them afresh
+        _table_lock.acquire()
+
+        try:
+            if self.source and self.source[0] == os.getpid():  self.source[1].close()
+            self.source = self.offsets = self.last = self.titles = None
+            Table.generation += 1  #  its titles may have moved, so every plan must look again
+        finally:
+            _table_lock.release()
+
+    def __getstate__(self):  #  a pickled Table remembers its index, not its open file
+        state = dict([(name, getattr(self, name)) for name in self.slot_names()])
+        state['source'] = state['last'] = None
+        return None, state
+
+    def index_records(self):
+        source = self.open_source()
+        source.seek(0)
+        self.titles = None
+        offsets = array.array('l')
+
+        for offset, record in self.read_records(source):
+            if not offsets and isinstance(record, dict):
+                self.titles = tuple([_json_cell(title) for title in record.keys()])
+                offsets.append(offset)  #  the title row has no line of its own
+
+            offsets.append(offset)
+
+        return offsets
+
+    def read_records(self, source):  #  yields each (offset, record), from the current position on
+        format = self.table_format()
+
+        if format == 'jsonl':
+            for offset, line in _file_lines(source):
+                if line.strip() != '':  yield offset, _json_record(line)
+            return
+
+        lines = _file_lines(source)
+        offsets = []
+
+        def feed():  #  csv pulls more lines when a quoted cell spans them
+            for offset, line in lines:
+                offsets.append(offset)
+                yield line
+
+        for record in csv.reader(feed(), delimiter = { 'tsv': '\t' }.get(format, ',')):
+            offset = offsets[0]
+            del offsets[:]
+            if record != []:  yield offset, record
+
+    def record_cells(self, record):
+        if isinstance(record, dict):
+            record = [record.get(title.decode('utf-8'), '') for title in self.titles]
+
+        return tuple([_json_cell(cell).strip() for cell in record])
+
+
+_table_lock = threading.RLock()
+
+def _file_lines(source):  #  each (offset, line) of a file, without reading ahead of what we yield
+    while True:
+        offset = source.tell()
+        line = source.readline()
+        if line == '':  return
+        yield offset, line
+
+def _json_record(line):  #  json arrived in Python 2.6, and kept an object's key order in 2.7
+    import json
+
+    try:
+        from collections import OrderedDict
+    except ImportError:
+        return json.loads(line)  #  the titles come out in hash order
+
+    return json.loads(line, object_pairs_hook = OrderedDict)
+
+def _json_cell(cell):
+    if isinstance(cell, unicode):  return cell.encode('utf-8')
+    if isinstance(cell, basestring):  return cell
+    import json
+    return json.dumps(cell)
+
 #  TODO  sample data with "post-it haiku"
 #  CONSIDER  trailing comments
 
 class Comment(Morelia):
+    __slots__ = ()
+
     def i_look_like(self):  return r'\#'
     def my_parent_type(self):  return Morelia # aka "any"
 
@@ -529,27 +1640,217 @@ class Comment(Morelia):
         return recon
 
     def to_html(self):
-        return '\n# <em>' + _clean_html(self.predicate) + '</em><br/>', ''
+        return _COMMENT_HTML % _clean_html(self.predicate), ''
+
+
+_pool_case = {}  #  what each worker process evaluates its test cases against
+
+def _install_pool_case(root, suite, instruments):
+    _pool_case['root'] = root
+    _pool_case['suite'] = suite
+    _pool_case['instruments'] = instruments
+
+def _evaluate_pool_case(case):
+    forks = [instrument.fork() for instrument in _pool_case['instruments']]
+    return _evaluate_cases(_pool_case['root'], _pool_case['suite'], [case], forks) + (forks,)
+
+def _evaluate_cases(root, suite, cases, instruments):  #  returns the Results, and the exception that stopped them
+    visitor = TestVisitor(suite, instruments = instruments)
+
+    try:
+        for path, step_indices, row_indices in cases:
+            scenario = _follow_path(root, path)
+            visitor.test_case(scenario, step_indices, row_indices)
+    except Exception, e:
+        return visitor.results, e
+
+    return visitor.results, None
+
+def _write_atomically(path, dump):  #  dump(file) fills a temporary file, and we rename it over path,
+    temp = '%s.%i' % (path, os.getpid())  #  so a reader never sees half of what we wrote
+    out = open(temp, 'wb')
+
+    try:
+        dump(out)
+    finally:
+        out.close()
+
+    os.rename(temp, path)
+
+def _file_hash(filename):  #  None for prose, or a file that's gone - we can't tell what changed
+    try:
+        return hashlib.sha1(open(filename, 'rb').read()).hexdigest()
+    except (IOError, TypeError):
+        return None
+
+def _case_key(filename, line_number, step_indices, row_indices):  #  one test case, in any run
+    return _case_path(filename), line_number, tuple(step_indices or ()), tuple(row_indices)
+
+def _case_path(filename):  #  relative to the working directory, so CI nodes that check out
+    if not filename:  return filename  #  to different folders still name each case alike
+    path = os.path.abspath(filename)
+    here = os.path.join(os.getcwd(), '')
+    if path.startswith(here):  return path[len(here):]
+    return path
+
+def _parse_shard(shard):
+    match = re.match(r'^\s*(\d+)\s*/\s*(\d+)\s*$', str(shard))
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise ValueError('a shard looks like 3/8, counting from 1, not %r' % (shard,))
+    return int(match.group(1)), int(match.group(2))
+
+def _partition(cases, costs, count):  #  longest case first, into the lightest shard - the same split every time
+    shards = [[] for x in range(count)]
+    loads = [(0.0, 0, x) for x in range(count)]  #  (seconds, cases, shard) - a heap, so ties break the same way
+    order = sorted(range(len(cases)), key = lambda x: (-costs[x], x))
+
+    for x in order:
+        load, size, idx = heapq.heappop(loads)
+        shards[idx].append(cases[x])
+        heapq.heappush(loads, (load + costs[x], size + 1, idx))
+
+    return shards
+
+def _select_every(selects):  #  one select function that wants a case only if all of these do
+    if not selects:  return None
+    return lambda *case:  all([select(*case) for select in selects])
 
+def _node_path(node):  #  the child indices that lead from the root of a tree down to this node
+    path = []
+
+    while node.parent:
+        path.insert(0, node.parent.steps.index(node))
+        node = node.parent
+
+    return path
+
+def _follow_path(root, path):
+    for idx in path:  root = root.steps[idx]
+    return root
+
+def _split_lines(prose):  #  prose.split('\n'), one line at a time, without copying the prose
+    if isinstance(prose, basestring):
+        start = 0
+
+        while True:
+            end = prose.find('\n', start)
+            if end < 0:  break
+            yield prose[start:end]
+            start = end + 1
+
+        yield prose[start:]
+        return
+
+    if hasattr(prose, 'readline'):  prose = iter(prose.readline, '')
+    ended = True
+
+    for line in prose:
+        ended = line.endswith('\n')
+        if ended:  line = line[:-1]
+        yield line
+
+    if ended:  yield ''  #  what split() finds after the last linefeed
+
+def _percentile(samples, percent):  #  nearest rank, of sorted samples
+    rank = int(math.ceil(percent / 100.0 * len(samples)))
+    return samples[max(0, min(len(samples), rank) - 1)]
 
 def _special_range(n):  #  CONSIDER  better name
     return xrange(n) if n else [0]
 
 
 def _permute_indices(arr):
-    return list(_product(*_imap(_special_range, arr)))
+    return list(_iterate_indices(arr))
       #  tx to Chris Rebert, et al, on the Python newsgroup for curing my brainlock here!!
 
+def _iterate_indices(arr):  #  the same schedule, one row combination at a time
+    return _product(*_imap(_special_range, arr))
+
+def _cover_indices(arr, strength = 2):  #  a covering array - every <strength> rows of
+    pools = [tuple(_special_range(n)) for n in arr]  #  different tables meet at least once
+    live = [d for d, pool in enumerate(pools) if len(pool) > 1]
+
+    if len(live) <= strength:
+        for indices in _product(*pools):  yield indices
+        return
+
+    uncovered = set()
+
+    for dims in _combinations(live, strength):
+        for values in _product(*[pools[d] for d in dims]):
+            uncovered.add(tuple(zip(dims, values)))
+
+    order = sorted(uncovered)
+    cursor = 0
+
+    while uncovered:  #  greedily fill each row from the first uncovered tuple
+        while order[cursor] not in uncovered:  cursor += 1  #  each tuple gets skipped once, not rescanned
+        row = dict(order[cursor])
+
+        for d in live:
+            if d in row:  continue
+            partials = []  #  the other members of each tuple d's value would cover, split around d
+
+            for others in _combinations(sorted(row.items()), strength - 1):
+                partials.append((tuple([o for o in others if o[0] < d]), tuple([o for o in others if o[0] > d])))
+
+            best, best_count = 0, -1
+
+            for value in pools[d]:
+                cell = ((d, value),)
+                count = len([1 for before, after in partials if before + cell + after in uncovered])
+                if count > best_count:  best, best_count = value, count
+
+            row[d] = best
+
+        indices = tuple([row.get(d, 0) for d in range(len(pools))])
+
+        for dims in _combinations(live, strength):
+            uncovered.discard(tuple([(d, indices[d]) for d in dims]))
+
+        yield indices
+
+_cover_counts = {}  #  (table sizes, strength) -> rows in their covering array, so reports build each once
+
+def _cover_count(arr, strength):
+    key = (tuple(arr), strength)
+    if key not in _cover_counts:  _cover_counts[key] = len(list(_cover_indices(arr, strength)))
+    return _cover_counts[key]
+
 def _product(*args, **kwds):
     # product('ABCD', 'xy') --> Ax Ay Bx By Cx Cy Dx Dy
     # product(range(2), repeat=3) --> 000 001 010 011 100 101 110 111
     pools = map(tuple, args) * kwds.get('repeat', 1)
-    result = [[]]
-    for pool in pools:
-        result = [x+[y] for x in result for y in pool]
-    for prod in result:
-        yield tuple(prod) 
+    if () in pools:  return
+    indices = [0] * len(pools)
+
+    while True:
+        yield tuple([pool[i] for pool, i in zip(pools, indices)])
+
+        for n in range(len(pools) - 1, -1, -1):  #  an odometer - the last pool spins fastest
+            indices[n] += 1
+            if indices[n] < len(pools[n]):  break
+            indices[n] = 0
+        else:
+            return
         
+def _combinations(iterable, r):
+    # combinations('ABCD', 2) --> AB AC AD BC BD CD
+    pool = tuple(iterable)
+    if r > len(pool):  return
+    indices = range(r)
+
+    while True:
+        yield tuple([pool[i] for i in indices])
+
+        for n in range(r - 1, -1, -1):  #  find the rightmost index that can still move up
+            if indices[n] != n + len(pool) - r:  break
+        else:
+            return
+
+        indices[n] += 1
+        for m in range(n + 1, r):  indices[m] = indices[m - 1] + 1
+
 def _imap(function, *iterables):
     iterables = map(iter, iterables)
     while True:
@@ -559,6 +1860,62 @@ def _imap(function, *iterables):
         else:
             yield function(*args)
 
+def _literal_prefix(regex):  #  the text every match of this regex must start with
+    if re.search(r'\(\?[iLmsux]', regex):  return ''  #  flags apply to the whole regex
+    prefix = []
+    literal = True
+    depth = 0
+    in_set = False
+    chars = iter(regex)
+
+    for c in chars:
+        if c == '\\':
+            c = ''.join(itertools.islice(chars, 1))  #  the escaped character, or '' at the end
+            if literal and c and not c.isalnum():  prefix.append(c)
+            else:  literal = False
+            continue
+
+        if in_set:
+            in_set = c != ']'
+            continue
+
+        if c == '|' and depth == 0:  return ''  #  a top-level alternation has no common prefix
+        if c == '[':  in_set = True
+        if c == '(':  depth += 1
+        if c == ')':  depth -= 1
+        if not literal:  continue
+
+        if c in '?*{':
+            if prefix:  prefix.pop()  #  the last character was optional
+            literal = False
+        elif c in '.^$[()+':
+            literal = False
+        else:
+            prefix.append(c)
+
+    return ''.join(prefix)
+
+_FEATURE_HTML = '\n<div><table><tr style="background-color: #aaffbb;" width="100%%">' + \
+                '<td align="right" valign="top" width="100"><em>%s</em>:</td><td colspan="101">%s</td></tr></table></div>'
+_SCENARIO_HTML = '\n<div><table width="100%%"><tr style="background-color: #cdffb8;">' + \
+                 '<td align="right" valign="top" width="100"><em>%s</em>:</td><td colspan="101">%s</td></tr>'
+_STEP_HTML = '\n<tr><td align="right" valign="top"><em>%s</em></td><td colspan="101">%s</td></tr>'
+_WHEN_HTML = '\n<tr style="background-color: #cdffb8; background: url(http://www.zeroplayer.com/images/stuff/aqua_gradient.png) ' + \
+             'no-repeat; background-size: 100%%;"><td align="right" valign="top"><em>%s</em></td><td colspan="101">%s</td></tr>'
+_CELL_HTML = '<td style="background-color: %s;"><%s>%s</%s></td>'
+_COMMENT_HTML = '\n# <em>%s</em><br/>'
+
+_RESULTS_SCENARIO_HTML = '\n<div><table width="100%%"><tr style="background-color: #cdffb8;">' + \
+        '<td align="right" valign="top" width="100"><em>Scenario</em>:</td><td colspan="3">%(scenario)s</td></tr>' + \
+        '\n<tr><td></td><td colspan="3">line %(line_number)s: %(passed)i passed, %(failed)i failed, ' + \
+        '%(seconds).3f seconds (%(share).0f%%)</td></tr>'
+_RESULT_HTML = '\n<tr style="background-color: %(color)s;"><td align="right" valign="top"><em>%(status)s</em></td>' + \
+        '<td align="right" valign="top" width="100">%(milliseconds).1f ms</td>' + \
+        '<td valign="top" width="100">rows %(rows)s</td><td>%(steps)s%(fault)s</td></tr>'
+_RESULT_STEP_HTML = '<em>%s</em> %s<br/>'
+_RESULT_FAULT_HTML = '<pre>%s</pre>'
+_RESULT_COLORS = { 'pass': '#eeffee', 'fail': '#ffdddd' }
+
 def _clean_html(string):
     return string.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;'). \
                             replace('"', '&quot;').replace("'", '&#39;')
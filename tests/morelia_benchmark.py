@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+#  how much memory a big table's Row nodes cost - run it in a fresh process:
+#
+#      python morelia_benchmark.py [rows]
+
+import os
+import sys
+import time
+pwd = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(pwd, '../morelia'))
+from morelia import *
+
+
+def resident_kilobytes():  #  Linux only; elsewhere we report nothing
+    try:
+        for line in open('/proc/self/status'):
+            if line.startswith('VmRSS:'):  return int(line.split()[1])
+    except IOError:
+        pass
+
+    return 0
+
+def build_table(rows):  #  link each Row straight to its Step, to weigh the nodes, not the parser
+    step = Step()._parse('party <zone> with <crunk>', [], 1)
+    owner = [step]
+    Row()._parse('zone | crunk', owner, 2)
+
+    for x in xrange(rows):
+        Row()._parse('zone %i | crunk %i' % (x, x), owner, x + 3).cells()
+
+    return step
+
+def benchmark(rows):
+    before = resident_kilobytes()
+    start = time.time()
+    step = build_table(rows)
+    elapsed = time.time() - start
+    kilobytes = resident_kilobytes() - before
+    print '%i rows: %.1f MB, %i bytes per Row, %.2f seconds' % \
+              (len(step.steps) - 1, kilobytes / 1024.0, kilobytes * 1024 / rows, elapsed)
+    return step
+
+
+if __name__ == '__main__':
+    rows = 100000
+    if len(sys.argv) > 1:  rows = int(sys.argv[1])
+    benchmark(rows)
@@ -10,7 +10,8 @@ pwd = os.path.dirname(os.path.realpath(__file__))
 morelia_path = os.path.join(pwd, '../morelia')
 sys.path.insert(0, morelia_path)
 from morelia import *
-from morelia import _permute_indices
+from morelia import _permute_indices, _product, _combinations, _cover_indices, _literal_prefix, \
+                    _node_path, _follow_path, _percentile, _split_lines
 
 #  CONSIDER  same order as morelia.feature, & vice-versa
 
@@ -196,6 +197,13 @@ class MoreliaSuite(TestCase):
         assert issubclass(Given, Given)
         assert not issubclass(Scenario, Given)
 
+    def test_lexer_compiles_thangs_once(self):
+        lexer, owners = Parser()._lexer()
+        assert lexer is Parser()._lexer()[0]
+        steps = Parser().parse_feature('Feature: f\n Scenario: s\n  Givenfoo\n  | a |\n  # c')
+        self.assertEqual([Feature, Scenario, Row, Comment], [s.__class__ for s in steps])
+        self.assertEqual('s\nGivenfoo', steps[1].predicate)
+
     def test_i_look_like(self):
         self.assertEqual('Step', Step().i_look_like())
         self.assertEqual('Given', Given().i_look_like())
@@ -239,6 +247,34 @@ class MoreliaSuite(TestCase):
         self.assertEqual(expect, _permute_indices([1,1,1]))
         expect = [(0, 0, 0), (0, 0, 1)]
         self.assertEqual(expect, _permute_indices([1,1,2]))
+        self.assertEqual([()], _permute_indices([]))
+        self.assertEqual([], list(_product(range(2), [])))
+
+    def test_pairwise_schedule_covers_every_pair(self):
+        rows = list(_cover_indices([3, 0, 3, 3, 3]))
+        assert len(rows) < 3 * 3 * 3 * 3
+
+        for a, b in [(0, 2), (0, 3), (0, 4), (2, 3), (2, 4), (3, 4)]:
+            pairs = set([(row[a], row[b]) for row in rows])
+            self.assertEqual(9, len(pairs))
+
+        self.assertEqual(_permute_indices([2, 0, 3]), list(_cover_indices([2, 0, 3])))
+        self.assertEqual([(0, 1), (0, 2), (1, 2)], list(_combinations(range(3), 2)))
+        self.assertEqual([], list(_combinations(range(2), 3)))
+
+    def test_evaluate_each_row_once(self):
+        global crunks, zones
+        crunks = []
+        zones = []
+        scene = self.assemble_scene_table_source('Step flesh is weak\n')
+        Parser().parse_features(scene).evaluate(self, strength = 1)
+        self.assertEqual([ 'work', 'mall', 'jail' ], crunks)
+        self.assertEqual([ 'beach', 'hotel' ], sorted(set(zones)))
+
+    def test_report_pairwise_schedule(self):
+        scene = self.assemble_scene_table_source('Step flesh is weak\n')
+        rep = Parser().parse_features(scene).report(self, strength = 1)
+        assert '<em>each row</em>: 3 of 6 row combinations' in rep
 
     def assemble_scene_table_source(self, moar = ''):
         return '''Feature: permute tables
@@ -263,7 +299,8 @@ class MoreliaSuite(TestCase):
         self.assemble_scene_table('Step you betcha\n')
         scenario = self.table_scene.steps[0].steps[0]
         schedule = scenario.permute_schedule()
-        self.assertEqual(expect, schedule)
+        self.assertEqual(expect[0], schedule.next())  #  rows come on demand
+        self.assertEqual(expect[1:], list(schedule))
 
     def test_evaluate_permuted_schedule(self):
         self.assemble_scene_table('Step flesh is weak\n')
@@ -272,10 +309,12 @@ class MoreliaSuite(TestCase):
         global crunks, zones
         crunks = []
         zones = []
-        scenario.row_indices = [1, 0, 2]
-        scenario.evaluate_test_case(visitor)
-        self.assertEqual('hotel', visitor.suite.got_party_zone)
-        self.assertEqual('jail', visitor.suite.got_crunk)
+        context = Context(self, [1, 0, 2])
+        scenario.evaluate_test_case(visitor, context)
+        self.assertEqual('hotel', context.suite.got_party_zone)
+        self.assertEqual('jail', context.suite.got_crunk)
+        assert visitor.suite is self  #  each case gets its own suite, and the tree keeps no rows
+        self.assertEqual(0, len([step for step in scenario.steps if hasattr(step, 'matches')]))
 
     def test_another_two_dimensional_table(self):
         global crunks, zones
@@ -319,6 +358,30 @@ class MoreliaSuite(TestCase):
            
         self.assertEqual(['crane \| wife', 'three'], harvest('crane \| wife | three'))
 
+    def test_Row_cells_parse_once(self):
+        r = Row()._parse('faction | element | faction |')
+        assert r.cells() is r.cells()
+        self.assertEqual(('faction', 'element', 'faction'), r.cells())
+        self.assertEqual(0, r.column('faction'))
+        self.assertEqual(1, r.column('element'))
+        self.assertEqual(None, r.column('elephant'))
+        r.predicate += ' moar |'
+        self.assertEqual(('faction', 'element', 'faction', 'moar'), r.cells())
+
+    def test_link_nodes_to_their_latest_ancestors(self):
+        rows = ''.join(['\n   | %i |' % x for x in range(5000)])
+        source = 'Feature: f\n Scenario: s\n  Given a\n   | x |' + rows + '\n  # c\n  Then b\n Scenario: t\n  Step: c'
+        steps = Parser().parse_features(source).steps
+        feature, scenario, given = steps[:3]
+        self.assertEqual(5001, len(given.steps))
+        comment, then, second, step = steps[-4:]
+        assert comment.parent is steps[-5]  #  a Comment belongs to whatever came before it
+        assert then.parent is scenario
+        self.assertEqual([scenario, second], feature.steps)
+        self.assertEqual([step], second.steps)
+        p = Parser().parse_features('Feature: f\n Scenario: s')
+        self.assertRaises(SyntaxError, p.parse_features, 'Feature: g')
+
     def step_party_zone(self, zone):  #  CONSIDER  prevent collision with another "step_party"
         r'party (\w+)'  #  CONSIDER  illustrate how the patterns here form testage too
 
@@ -372,6 +435,17 @@ class MoreliaSuite(TestCase):
         step = p.steps[0].steps[0].steps[0]
         self.assertEqual(step.concept + ': ' + step.predicate, step.reconstruction().strip())
 
+    def test_substitution_plan(self):
+        p = Parser().parse_features(self.assemble_short_scene_table())
+        step = p.steps[0].steps[0].steps[0]
+        plan = ['party ', (0, 1, 'element'), ' from ', (0, 0, 'faction'), '']
+        self.assertEqual(plan, step.substitution_plan())
+        assert step.substitution_plan() is step.substitution_plan()
+        plan = step.substitution_plan()
+        Table.generation += 1  #  as when a Table file changes under a Watcher
+        assert step.substitution_plan() is not plan
+        self.assertEqual('party Laurasia from Glyptodon', step.augment_predicate([1]))
+
     def step_party_element_from_faction(self, element, faction):
         r'party (\w+) from (\w+)'
             #  TODO  don't default to this "party <element> in <faction>"  
@@ -404,20 +478,78 @@ class MoreliaSuite(TestCase):
 
     def test_find_step_by_name(self):
         step = Given()._parse('my milkshake')
-        step.find_by_name(self)
-        expect = self.step_my_milkshake
-        self.assertEqual(expect, step.method)
+        self.assertEqual(('step_my_milkshake', ()), step.find_by_name(self))
 
     def test_find_step_by_doc_string(self):
         step = And()._parse('my milkshake brings all the boys to the yard')
-        method = step.find_by_doc_string(self)
-        expect = self.step_my_milkshake
-        self.assertEqual(expect, step.method)
+        name, matches = step.find_by_doc_string(self)
+        self.assertEqual('step_my_milkshake', name)
 
     def test_find_step_with_match(self):
         step = When()._parse('my milkshake brings all the girls to the yard')
-        step.find_by_doc_string(self)
-        self.assertEqual(('girls', 'the'), step.matches)
+        name, matches = step.find_by_doc_string(self)
+        self.assertEqual(('girls', 'the'), matches)
+
+    def test_step_registry_scans_each_suite_class_once(self):
+        registry = StepRegistry.of(self)
+        assert registry is StepRegistry.of(MoreliaSuite('test_feature'))
+        assert 'step_my_milkshake' in registry.methods
+        assert 'step_party_zone' in [name for prefix, name, doc in registry.candidates('party beach')]
+        assert 'step_I_press_add' not in [name for prefix, name, doc in registry.candidates('I press add')]  #  no doc string
+
+    def test_literal_prefix(self):
+        self.assertEqual('I have entered ', _literal_prefix(r'I have entered (\d+) into the calculator'))
+        self.assertEqual('my milkshake brings all the ', 
+                         _literal_prefix(r'my milkshake brings all the (boys|girls) to (.*) yard'))
+        self.assertEqual('tick.', _literal_prefix(r'tick\.s?'))
+        self.assertEqual('part', _literal_prefix(r'party*'))
+        self.assertEqual('', _literal_prefix(r'boys|girls'))
+        self.assertEqual('', _literal_prefix(r'(?i)party'))
+        self.assertEqual('a', _literal_prefix(r'a[(|]b'))
+
+    def test_ambiguous_steps_prefer_the_longest_literal_prefix(self):
+        class Ambiguous(object):
+            def step_a_party(self, what):
+                r'party (.+)'
+            def step_b_party_hat(self, color):
+                r'party hat (.+)'
+            def step_c_anything(self, what):
+                r'(.+)'
+
+        step = Given()._parse('party hat red')
+        self.assertEqual('step_b_party_hat', step.find_by_doc_string(Ambiguous())[0])
+        step = Given()._parse('party on')
+        self.assertEqual('step_a_party', step.find_by_doc_string(Ambiguous())[0])
+        step = Given()._parse('bash')
+        self.assertEqual(('step_c_anything', ('bash',)), step.find_by_doc_string(Ambiguous()))
+
+    def test_rows_bind_the_same_step_in_any_order(self):
+        class Ambiguous(object):
+            def step_a_party(self, what):
+                r'party (.+)'
+            def step_b_party_hat(self, color):
+                r'party hat (.+)'
+
+        for rows in [['on', 'hat red'], ['hat red', 'on']]:
+            source = 'Feature: ambiguous\nScenario: rows\nGiven party <x>\n| x |\n| %s |\n| %s |' % tuple(rows)
+            step = Parser().parse_features(source).steps[2]
+            found = [step.find_step(Ambiguous(), [x]) for x in range(len(rows))]
+            self.assertEqual(('step_b_party_hat', ('red',)), found[rows.index('hat red')])
+            self.assertEqual(('step_a_party', ('on',)), found[rows.index('on')])
+
+    def test_steps_bind_once_across_rows(self):
+        scene = self.assemble_scene_table_source('Step flesh is weak\n')
+        given = Parser().parse_features(scene).steps[2]
+        self.assertEqual('step_party_zone', given.find_step_name(self, [0, 0, 0]))
+        klass, name, doc, key, ahead = given.binding
+        self.assertEqual((MoreliaSuite, 'step_party_zone'), (klass, name))
+        registry = StepRegistry._registries[MoreliaSuite]
+        StepRegistry._registries[MoreliaSuite] = object()  #  so a second lookup would croak
+
+        try:
+            self.assertEqual(('step_party_zone', ('hotel',)), given.find_step(self, [1, 0, 0]))
+        finally:
+            StepRegistry._registries[MoreliaSuite] = registry
 
     def test_step_not_found(self):
         step = Then()._parse('not there')
@@ -462,6 +594,72 @@ class MoreliaSuite(TestCase):
         step = feature.steps[3].steps[1]
         assert filename == step.get_filename()
 
+    def test_cache_parsed_trees(self):
+        cache = self.scratch_folder()
+        filename = os.path.join(cache, 'sums.feature')
+        open(filename, 'w').write('Feature: sums\n Scenario: add\n  Step: my milkshake\n   | a |\n   | b |')
+
+        fresh = Parser().parse_file(filename, cache)
+        p = Parser()
+        p.parse_features = None  #  so parsing again would croak
+        cached = p.parse_file(filename, cache)
+        self.assertEqual([s.reconstruction() for s in fresh.steps], [s.reconstruction() for s in cached.steps])
+        self.assertEqual(filename, cached.steps[4].get_filename())
+        assert cached.steps[4].parent is cached.steps[2]
+        open(filename, 'a').write('\n   | c |')
+        self.assertEqual(6, len(Parser().parse_file(filename, cache).steps))
+
+    def test_parse_lines_from_files(self):
+        from StringIO import StringIO
+        for source in ['', '\n', 'a\n\nb']:
+            self.assertEqual(source.split('\n'), list(_split_lines(StringIO(source))))
+
+        sources = [ 'Feature: f', 'Feature: f\n', self.assemble_short_scene_table() + '\n\n',
+                    'Given a string \\\n And another string\\\n' ]
+
+        for source in sources:
+            expect = [s.reconstruction() for s in Parser().parse_feature(source)]
+            self.assertEqual(source.split('\n'), list(_split_lines(source)))
+            self.assertEqual(source.split('\n'), list(_split_lines(StringIO(source))))
+            self.assertEqual(expect, [s.reconstruction() for s in Parser().parse_feature(StringIO(source))])
+
+        self.assertEqual(['a', 'b'], list(_split_lines(['a', 'b'])))
+
+    def test_tables_stream_from_files(self):
+        if self.lacks('json', 'multiprocessing'):  return
+        folder = self.scratch_folder()
+        filename = os.path.join(folder, 'tables.feature')
+        open(os.path.join(folder, 'zones.csv'), 'w').write('zone,note\nbeach,sunny\n"hotel","two\nlines"\n\n')
+        open(os.path.join(folder, 'crunks.jsonl'), 'w').write('{"crunk": "work"}\n\n{"crunk": "mall"}\n{"crunk": 42}\n')
+        open(filename, 'w').write('''Feature: permute tables
+                                      Scenario: turn one feature into many
+                                        Given party <zone>
+                                          Table: zones.csv
+                                        Then hearty <crunk>
+                                          Table: crunks.jsonl''')
+        global crunks, zones
+        crunks = []
+        zones = []
+
+        p = Parser().parse_file(filename)
+        table = p.steps[3]
+        self.assertEqual(Table, table.__class__)
+        self.assertEqual([2, 3], p.steps[1].count_Row_dimensions())
+        self.assertEqual(('hotel', 'two\nlines'), table[2].cells())
+        self.assertEqual(('crunk',), p.steps[5][0].cells())
+        p.evaluate(self)
+        self.assertEqual(['work', 'mall', '42'] * 2, crunks)
+        self.assertEqual(['beach'] * 3 + ['hotel'] * 3, zones)
+        del crunks[:], zones[:]
+        p.evaluate(self, threads = 3)
+        self.assertEqual(['42', '42', 'mall', 'mall', 'work', 'work'], sorted(crunks))
+        import cPickle
+        copy = cPickle.loads(cPickle.dumps(p.steps, cPickle.HIGHEST_PROTOCOL))  #  a run tree still pickles
+        self.assertEqual(('hotel', 'two\nlines'), copy[3][2].cells())
+        assert '<em>Table</em>: zones.csv (2 rows)' in p.report(self)
+        for prose in ['Table stakes', 'Table: of contents']:
+            self.assertEqual('prose', Parser().parse_features('Feature: f\n %s\n prose' % prose).steps[0].predicate[-5:])
+
     def test_format_faults_like_python_errors(self):
         filename = pwd + '/morelia.feature'
         thang = Parser().parse_file(filename)
@@ -481,8 +679,312 @@ class MoreliaSuite(TestCase):
         thang = Parser().parse_file(pwd + '/morelia.feature')
         thang.evaluate(self)
 
+    def test_evaluate_file_in_a_process_pool(self):
+        if self.lacks('multiprocessing'):  return
+        thang = Parser().parse_file(pwd + '/morelia.feature')
+        thang.evaluate(self, processes = 2)
+
+    def test_evaluate_file_in_a_thread_pool(self):
+        if self.lacks('multiprocessing'):  return
+        thang = Parser().parse_file(pwd + '/morelia.feature')
+        thang.evaluate(self, threads = 4)
+
+    def test_thread_pool_shares_one_tree_across_cases(self):
+        if self.lacks('multiprocessing'):  return
+        global crunks, zones
+        crunks = []
+        zones = []
+        source = self.assemble_scene_table_source('Step flesh is weak\n') + \
+                 '\n    Scenario: Add two numbers' + \
+                 '\n        Given I have entered 50 into the calculator' + \
+                 '\n         When I press add' + \
+                 '\n         Then the result should be 50 on the screen'
+        results = Parser().parse_features(source).evaluate(self, threads = 4)
+        self.assertEqual([ 'jail', 'jail', 'mall', 'mall', 'work', 'work' ], sorted(crunks))
+        self.assertEqual([ 'beach', 'beach', 'beach', 'hotel', 'hotel', 'hotel' ], sorted(zones))
+        self.assertEqual([ 'hearty work', 'hearty mall', 'hearty jail' ] * 2, 
+                         [ result.steps[-1][1] for result in results[:6] ])
+
+    def test_pools_report_the_first_fault(self):
+        if self.lacks('multiprocessing'):  return
+        source = self.assemble_scene_table_source('Step flesh is weak\n') + \
+                 '\n    Scenario: Add two numbers' + \
+                 '\n        Given I have entered 50 into the calculator' + \
+                 '\n         When I press add' + \
+                 '\n         Then the result should be 51 on the screen'
+        diagnostic = ''
+
+        for pool in [{'processes': 3}, {'threads': 3}]:
+            try:
+                Parser().parse_features(source).evaluate(self, **pool)
+            except AssertionError, e:
+                diagnostic = str(e)
+
+            self.assert_regex_contains('line 16, in \\\\nScenario: Add two numbers', diagnostic)
+            self.assert_regex_contains('Then: the result should be 51 on the screen', diagnostic)
+            diagnostic = ''
+
+    def assemble_sums_source(self, rows, moar = ''):
+        return '''Feature: sums
+                    Scenario: add
+                      Given I have entered <n> into the calculator
+                        | n  |
+%s
+                      When I press add
+                      Then the result should be 50 on the screen%s''' % \
+                   ('\n'.join(['                        | %i |' % n for n in rows]), moar)
+
+    def test_keep_going_collects_every_fault(self):
+        if self.lacks('multiprocessing'):  return
+        source = self.assemble_sums_source([50, 51, 50, 52])
+
+        for pool in [{}, {'processes': 2}, {'threads': 2}]:
+            p = Parser().parse_features(source)
+
+            try:
+                p.evaluate(self, keep_going = True, **pool)
+                assert False  #  should raise!
+            except AssertionError, e:
+                diagnostic = str(e)
+
+            self.assert_regex_contains('2 of 4 test cases failed', diagnostic)
+            self.assertEqual(2, diagnostic.count('line 10, in'))
+            self.assertEqual(['pass', 'fail', 'pass', 'fail'], [result.status for result in p.results])
+            self.assertEqual([('Given', 'I have entered 51 into the calculator'), ('When', 'I press add'),
+                              ('Then', 'the result should be 50 on the screen')], p.results[1].steps)
+
+        p = Parser().parse_features(source)
+        self.assertRaises(AssertionError, p.evaluate, self, processes = 2, fail_fast = True)
+        self.assertEqual('fail', p.results[-1].status)
+        self.assertRaises(ValueError, p.evaluate, self, keep_going = True, fail_fast = True)
+
+    def test_rerun_the_cases_that_did_not_pass(self):
+        if self.lacks('json', 'multiprocessing'):  return
+        import json, tempfile
+        source = self.assemble_sums_source([50, 51, 50, 52])
+        handle, last_run = tempfile.mkstemp('.json')
+        os.close(handle)
+        rows = lambda p: [result.row_indices[0] for result in p.results]
+
+        try:
+            p = Parser().parse_features(source)
+            self.assertRaises(AssertionError, p.evaluate, self, last_run = last_run)
+            self.assertEqual([0, 1], rows(p))  #  the first fault stopped the run
+            records = json.load(open(last_run))['cases']
+            self.assertEqual(['pass', 'fail'], [record['status'] for record in records])
+            self.assertEqual([2, [0, 1, 2], [1, 0, 0]], [records[1][k] for k in ['line', 'steps', 'rows']])
+            self.assertRaises(AssertionError, p.rerun, self, last_run, keep_going = True)
+            self.assertEqual([1, 2, 3], rows(p))
+            self.assertRaises(AssertionError, p.rerun, self, last_run, threads = 2, keep_going = True)
+            self.assertEqual([1, 3], rows(p))
+        finally:
+            if os.path.exists(last_run):  os.remove(last_run)
+
+    def test_rerun_forgets_a_feature_file_that_changed(self):
+        if self.lacks('json'):  return
+        folder = self.scratch_folder()
+        filename = os.path.join(folder, 'moved.feature')
+        last_run = os.path.join(folder, 'last_run.json')
+        scenarios = ['Scenario: a\n  Step flesh is weak', 'Scenario: b\n  Step exceptional']
+        write = lambda: open(filename, 'w').write('\n'.join(['Feature: moves'] + scenarios))
+        ran = lambda: [result.line_number for result in p.results]
+
+        write()
+        p = Parser().parse_file(filename)
+        self.assertRaises(AssertionError, p.evaluate, self, last_run = last_run, keep_going = True)
+        self.assertEqual([2, 4], ran())
+        scenarios.insert(0, 'Scenario: new\n  Step exceptional')  #  it lands on a's old line
+        write()
+        p = Parser().parse_file(filename)
+        self.assertRaises(AssertionError, p.rerun, self, last_run, keep_going = True)
+        self.assertEqual([2, 4, 6], ran())
+
+    def test_shards_split_the_cases_once_each(self):
+        if self.lacks('json'):  return
+        import json, tempfile
+        source = self.assemble_sums_source([50, 50, 50, 50], '''
+                    Scenario: milkshake
+                      Step my milkshake brings all the girls to the yard''')
+        handle, last_run = tempfile.mkstemp('.json')
+        os.close(handle)
+        p = Parser().parse_features(source)
+        cases = p.cases(self)
+        self.assertEqual([2, 2, 2, 2, 11], [case[1] for case in cases])
+        shards = lambda count: [Shard('%i/%i' % (x, count), [p], self, last_run = last_run).cases
+                                  for x in range(1, count + 1)]
+
+        try:
+            self.assertEqual([3, 2], map(len, shards(2)))  #  no history - count the cases
+            self.assertEqual(sorted(cases), sorted(sum(shards(3), [])))
+            self.assertEqual(shards(3), shards(3))
+            second = [case[3] for case in shards(2)[1]]
+            self.assertEqual(second, [result.row_indices for result in p.evaluate(self, shard = '2/2', last_run = last_run)])
+            p.evaluate(self, last_run = last_run)
+            stored = json.load(open(last_run))
+            for record in stored['cases']:  record['duration'] = 1.0
+            stored['cases'][0]['duration'] = 4.0
+            json.dump(stored, open(last_run, 'w'))
+            self.assertEqual([[cases[0]], cases[1:]], shards(2))  #  the slow case gets a shard to itself
+            self.assertEqual(['pass'], [result.status for result in p.evaluate(self, shard = '1/2', last_run = last_run)])
+            self.assertRaises(ValueError, Shard, '3/2', [p], self)
+            self.assertRaises(ValueError, Shard, 'half', [p], self)
+        finally:
+            if os.path.exists(last_run):  os.remove(last_run)
+
+    def test_shards_agree_across_checkouts(self):
+        if self.lacks('json'):  return
+        import json, shutil
+        here = os.getcwd()
+        splits = []
+
+        for checkout in ['node1', 'node2']:  #  two CI nodes, each with the same tree in its own folder
+            folder = os.path.join(self.scratch_folder(), checkout)
+            os.mkdir(folder)
+            open(os.path.join(folder, 'sums.feature'), 'w').write(self.assemble_sums_source([50, 50, 50, 50]))
+            if splits:  shutil.copy(os.path.join(self.scratch, 'node1', 'last_run.json'), folder)
+            os.chdir(folder)
+
+            try:
+                p = Parser().parse_file('sums.feature')
+
+                if not splits:
+                    p.evaluate(self, last_run = 'last_run.json')
+                    stored = json.load(open('last_run.json'))
+                    for record in stored['cases']:  record['duration'] = 1.0
+                    stored['cases'][0]['duration'] = 4.0
+                    json.dump(stored, open('last_run.json', 'w'))
+
+                splits.append([Shard('%i/2' % x, [p], self, last_run = 'last_run.json').cases for x in (1, 2)])
+            finally:
+                os.chdir(here)
+
+        self.assertEqual(splits[0], splits[1])
+        self.assertEqual([1, 3], map(len, splits[1]))  #  both balanced by duration, not by count
+
+    def test_impact_map_runs_only_what_changed(self):
+        if self.lacks('json'):  return
+        import json
+        folder = self.scratch_folder()
+        filename = os.path.join(folder, 'impact.feature')
+        impact = os.path.join(folder, 'impact.json')
+        source = '''Feature: impact
+                     Scenario: add
+                       Given I have entered 50 into the calculator
+                       When I press add
+                       Then the result should be 50 on the screen
+                     Scenario: milkshake
+                       Step my milkshake brings all the girls to the yard'''
+        open(filename, 'w').write(source)
+        ran = lambda: [result.line_number for result in Parser().parse_file(filename).evaluate(self, impact = impact)]
+
+        self.assertEqual([2, 6], ran())
+        self.assertEqual([], ran())
+        stored = json.load(open(impact))
+        self.assertEqual([['MoreliaSuite.step_I_have_entered_a_number_into_the_calculator',
+                           'MoreliaSuite.step_I_press_add', 'MoreliaSuite.step_the_result_should_be_on_the_screen'],
+                          ['MoreliaSuite.step_my_milkshake']],
+                         [record['methods'] for record in stored['scenarios']])
+        stored['methods']['MoreliaSuite.step_my_milkshake'] = 'an older version'
+        json.dump(stored, open(impact, 'w'))
+        self.assertEqual([6], ran())
+        self.assertEqual([], ran())
+        open(filename, 'a').write('\n                       Step flesh is weak')
+        self.assertEqual([2, 6], ran())
+        self.assertEqual([], ran())
+
+    def test_impact_map_hashes_table_files(self):
+        if self.lacks('json'):  return
+        folder = self.scratch_folder()
+        filename = os.path.join(folder, 'impact.feature')
+        table = os.path.join(folder, 'z.csv')
+        open(table, 'w').write('n\n50\n')
+        open(filename, 'w').write(self.assemble_sums_source([]).replace('| n  |', 'Table: z.csv'))
+        impact = os.path.join(folder, 'impact.json')
+
+        self.assertEqual(1, len(Parser().parse_file(filename).evaluate(self, impact = impact)))
+        self.assertEqual([], Parser().parse_file(filename).evaluate(self, impact = impact))
+        open(table, 'a').write('51\n')
+        p = Parser().parse_file(filename)
+        self.assertRaises(AssertionError, p.evaluate, self, impact = impact, keep_going = True)
+        self.assertEqual(['pass', 'fail'], [result.status for result in p.results])
+
+    def test_watcher_reruns_what_changed(self):
+        if self.lacks('json'):  return
+        from StringIO import StringIO
+        folder = self.scratch_folder()
+        filename = os.path.join(folder, 'watch.feature')
+        source = '''Feature: watch
+                     Scenario: add
+                       Given I have entered 50 into the calculator
+                       When I press add
+                       Then the result should be <sum> on the screen
+                         | sum |
+                         | 50  |'''
+        open(filename, 'w').write(source)
+        stream = StringIO()
+
+        watcher = Watcher(self, [filename], impact = os.path.join(folder, 'impact.json'), stream = stream)
+        self.assertEqual(1, len(watcher.run()))
+        self.assertEqual([], watcher.run())
+        self.assertEqual([], watcher.poll())
+        open(filename, 'w').write(source + '\n                         | 51  |')
+        os.utime(filename, (0, 0))  #  in case the edit landed inside the same mtime tick
+        self.assertEqual([filename], watcher.poll())
+        watcher.update([filename])
+        self.assertEqual(['pass', 'fail'], [result.status for result in watcher.run()])
+        self.assertEqual(2, len(watcher.run()))  #  a Scenario that failed runs until it passes
+        self.assertEqual('1 cases ran, 0 failed\n0 cases ran, 0 failed\n', stream.getvalue()[:44])
+        table = os.path.join(folder, 'sums.csv')
+        open(table, 'w').write('sum\n50\n')
+        open(filename, 'w').write(source.split('|')[0] + 'Table: sums.csv')
+        watcher.update(watcher.poll())
+        self.assertEqual(['pass'], [result.status for result in watcher.run()])
+        self.assertEqual([], watcher.run())
+        open(table, 'w').write('sum\n51\n50\n')  #  the offsets we knew are wrong now
+        os.utime(table, (0, 0))
+        self.assertEqual([table], watcher.poll())
+        watcher.update([table])
+        self.assertEqual(['fail', 'pass'], [result.status for result in watcher.run()])
+        open(table, 'w').write('note,sum\n51,50\n')  #  the same titles, in another order
+        os.utime(table, (1, 1))
+        watcher.update(watcher.poll())
+        self.assertEqual(['pass'], [result.status for result in watcher.run()])
+        open(filename, 'w').write('Feature: broken\nScenario: what\nFeature: again')
+        watcher.update(watcher.poll())
+        self.assertEqual([], watcher.run())
+        self.assert_regex_contains('Only one Feature per file', stream.getvalue())
+
+    def test_node_paths(self):
+        thang = Parser().parse_file(pwd + '/morelia.feature')
+        step = thang.steps[0].steps[3].steps[1]
+        path = _node_path(step)
+        self.assertEqual([3, 1], path)
+        assert step is _follow_path(thang.steps[0], path)
+
     def setUp(self):
         self.culture = []
+        self.scratch = None
+
+    def tearDown(self):
+        if self.scratch:
+            import shutil
+            shutil.rmtree(self.scratch)
+
+    def lacks(self, *modules):  #  Python 2.5 has no json or multiprocessing, so it passes their tests by
+        for module in modules:  #  returning early - its unittest can't skip them
+            try:
+                __import__(module)
+            except ImportError:
+                return True
+
+        return False
+
+    def scratch_folder(self):  #  a temporary folder for this test's files, gone when it ends
+        if not self.scratch:
+            import tempfile
+            self.scratch = tempfile.mkdtemp()
+
+        return self.scratch
 
     def step_adventure_of_love_love_and_culture_(self, culture):
         r'adventure of love - love and (.+)'
@@ -539,6 +1041,112 @@ class MoreliaSuite(TestCase):
       #  os.system('firefox /home/phlip/morelia/yo.html &')
         # os.system('konqueror  /home/phlip/morelia/yo.html &')
 
+    def test_stream_report(self):
+        from StringIO import StringIO
+        thang = Parser().parse_file(pwd + '/morelia.feature')
+        stream = StringIO()
+        self.assertEqual('', thang.report(self, stream = stream))
+        self.assertEqual(thang.report(self), stream.getvalue())
+        assert 0 < stream.getvalue().count('<div>')
+
+    def test_evaluate_records_results(self):
+        global crunks, zones
+        crunks = []
+        zones = []
+        scene = self.assemble_scene_table_source('Step flesh is weak\n')
+        results = Parser().parse_features(scene).evaluate(self)
+        self.assertEqual(6, len(results))
+        result = results[4]
+        self.assertEqual(('pass', [0], 2), (result.status, result.path, result.line_number))
+        self.assertEqual((1, 0, 1), result.row_indices)
+        self.assertEqual(('Given', 'party hotel'), result.steps[0])
+        self.assertEqual(('Then', 'hearty mall'), result.steps[2])
+
+    def test_report_results(self):
+        if self.lacks('multiprocessing'):  return
+        source = self.assemble_scene_table_source('Step flesh is weak\n') + \
+                 '\n    Scenario: Add two numbers' + \
+                 '\n        Given I have entered 50 into the calculator' + \
+                 '\n         When I press add' + \
+                 '\n         Then the result should be 51 on the screen'
+        p = Parser().parse_features(source)
+        self.assertRaises(AssertionError, p.evaluate, self, threads = 2)
+        self.assertEqual(['pass'] * 6 + ['fail'], [result.status for result in p.results])
+        assert 'Then: the result should be 51 on the screen' in p.results[-1].fault
+        html = p.report_results()
+        self.assertEqual(2, html.count('<div>'))
+        assert 'line 2: 6 passed, 0 failed' in html
+        assert 'line 13: 0 passed, 1 failed' in html
+        assert '<em>Then</em> hearty jail<br/>' in html
+        self.assertEqual(11, html.count('<tr'))
+        self.assertEqual([], Parser().parse_features(source).results)  #  each Parser keeps its own
+
+    def test_timing_collector(self):
+        if self.lacks('multiprocessing'):  return
+        global crunks, zones
+        scene = self.assemble_scene_table_source('Step flesh is weak\n')
+
+        for pool in [{}, {'processes': 2}, {'threads': 2}]:
+            crunks = []
+            zones = []
+            timer = TimingCollector()
+            Parser().parse_features(scene).evaluate(self, instruments = [timer], **pool)
+            count, p50, p95, most, total = timer.histogram('step_party_zone')
+            self.assertEqual(6, count)
+            assert p50 <= p95 <= most <= total
+            self.assertEqual(18, timer.histogram('(resolve)')[0])
+            self.assertEqual(6, timer.histogram('(setUp)')[0])
+            self.assertEqual(6, timer.histogram('(tearDown)')[0])
+            self.assertEqual(2, len(timer.slowest(2)))
+            report = timer.report(3).split('\n')
+            self.assertEqual(['count', 'p50', 'p95', 'max', 'total', 'step'], report[0].split())
+            self.assertEqual(5, len(report))
+
+    def test_feature_profiler_counts_every_thread(self):
+        import threading
+        profiler = FeatureProfiler()
+        work = lambda:  [profiler.add('step', 0.0, 0.0, 'scenario') for x in xrange(5000)]
+        threads = [threading.Thread(target = work) for x in range(8)]
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)  #  switch threads as often as we can
+
+        try:
+            for thread in threads:  thread.start()
+            for thread in threads:  thread.join()
+        finally:
+            sys.setcheckinterval(interval)
+
+        self.assertEqual(40000, profiler.costs['step'][0])
+        self.assertEqual(40000, profiler.costs['step'][3]['scenario'][0])
+
+    def test_feature_profiler(self):
+        if self.lacks('multiprocessing'):  return
+        import pstats, tempfile
+        filename = pwd + '/morelia.feature'
+        profiler = FeatureProfiler()
+        Parser().parse_file(filename).evaluate(self, instruments = [profiler], processes = 2)
+        self.assertEqual(1, profiler.costs[(filename, 14, 'Given: I have entered 50 into the calculator')][0])
+        self.assertEqual(9, profiler.costs[(filename, 54, 'When: we evaluate the file')][0])
+        report = profiler.report('calls', 5)
+        assert 'morelia.feature:54(When: we evaluate the file)' in report
+        handle, dump = tempfile.mkstemp('.prof')
+        os.close(handle)
+
+        try:
+            Parser().parse_file(filename).evaluate(self, profile = dump)
+            stats = pstats.Stats(dump)
+            caller = (filename, 52, 'Scenario: Convert source predicates into their matching regular expressions')
+            self.assertEqual(9, stats.stats[(filename, 54, 'When: we evaluate the file')][4][caller][0])
+        finally:
+            if os.path.exists(dump):  os.remove(dump)
+
+    def test_percentile(self):
+        samples = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        self.assertEqual(5, _percentile(samples, 50))
+        self.assertEqual(10, _percentile(samples, 95))
+        self.assertEqual(1, _percentile(samples, 0))
+        self.assertEqual(7, _percentile([7], 95))
+
     def step_a_feature_file_with_contents(self, file_contents):
         r'a feature file with "([^"]+)"'
         self.file_contents = file_contents
@@ -590,8 +1198,9 @@ class MoreliaSuite(TestCase):
     def step_we_evaluate_the_file(self):
         r'we evaluate the file'
 
-        self.viridis = Viridis()
-        self.suggestion = self.viridis.suggest_doc_string(self.predicate)
+        viridis = Viridis()
+        self.suggestion = viridis.suggest_doc_string(self.predicate)
+        self.arguments = viridis.suggest_arguments(self.predicate)
 
     def step_we_convert_it_into_a_(self, suggestion):
         r'we convert it into a (.+)'
@@ -601,7 +1210,7 @@ class MoreliaSuite(TestCase):
     def step_add_extra_arguments(self, extra = ''):  #  TODO  blank columns should exist!
         r'add (.+) arguments'
 
-        self.assertEqual(extra, self.viridis.extra_arguments)
+        self.assertEqual(extra, self.arguments)
 
     def step_a_file_contains_statements_produce_diagnostics_(self, statements, diagnostics):
         r'a file contains (.+), it produces (.+)'